@@ -0,0 +1,54 @@
+"""
+Time CBF reads of synthetic Pilatus 6M frames: full frames with fabio
+against the header-only read used for sweep metadata.
+
+    python benchmarks/bench_cbf.py [num_frames]
+"""
+
+import sys
+import tempfile
+import time as ttime
+from pathlib import Path
+
+import numpy as np
+from fabio import cbfimage
+
+from nyxtools.cbf import read_cbf, read_cbf_header
+
+PILATUS_6M_SHAPE = (2527, 2463)
+
+
+def write_frames(directory, num_frames):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(num_frames):
+        data = rng.poisson(3.0, PILATUS_6M_SHAPE).astype(np.int32)
+        data[:, 487::494] = -1
+        data[195::212, :] = -1
+        spots = rng.integers(0, data.size, 2000)
+        data.flat[spots] = rng.integers(200, 100000, spots.size)
+        fpath = Path(directory) / f"bench_{i + 1:05d}.cbf"
+        cbfimage.CbfImage(data=data).write(str(fpath))
+        paths.append(fpath)
+    return paths
+
+
+def run(label, reader, paths):
+    start = ttime.perf_counter()
+    for fpath in paths:
+        reader(fpath)
+    elapsed = ttime.perf_counter() - start
+    print(f"{label:>8}: {len(paths) / elapsed:8.1f} frames/s ({1000 * elapsed / len(paths):.1f} ms/frame)")
+
+
+def main(num_frames=20):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_frames(directory, num_frames)
+        # Warm the page cache so every reader sees the same I/O cost
+        run("warmup", lambda fpath: fpath.read_bytes(), paths)
+        run("frame", read_cbf, paths)
+        run("header", read_cbf_header, paths)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,38 @@
+"""
+Scaling of multi-frame reads with the number of thread and process workers.
+
+    python benchmarks/bench_read_frames.py [num_frames] [max_workers]
+"""
+
+import os
+import sys
+import tempfile
+import time as ttime
+
+from bench_cbf import write_frames
+
+from nyxtools.handlers import read_frames
+
+
+def run(label, paths, **kwargs):
+    start = ttime.perf_counter()
+    read_frames(paths, **kwargs)
+    elapsed = ttime.perf_counter() - start
+    print(f"{label:>14}: {len(paths) / elapsed:8.1f} frames/s")
+    return elapsed
+
+
+def main(num_frames=40, max_workers=os.cpu_count()):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_frames(directory, num_frames)
+        baseline = run("1 worker", paths, max_workers=1)
+        workers = 2
+        while workers <= max_workers:
+            for mode, use_processes in (("threads", False), ("processes", True)):
+                elapsed = run(f"{workers} {mode}", paths, max_workers=workers, use_processes=use_processes)
+                print(f"{'':>14}  speedup x{baseline / elapsed:.2f}")
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
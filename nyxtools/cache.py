@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class FrameCache:
+    """
+    Bounded LRU cache of decoded detector frames.
+
+    Entries are keyed by (absolute path, mtime, size) so a file rewritten on
+    disk is never served stale, and evicted least-recently-used first once
+    the decoded arrays exceed ``max_bytes``. Cached arrays are made
+    read-only as they are shared between all callers.
+    """
+
+    def __init__(self, max_bytes=2 * 1024**3):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(fpath):
+        fpath = os.path.abspath(fpath)
+        stat = os.stat(fpath)
+        return (fpath, stat.st_mtime_ns, stat.st_size)
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        data.flags.writeable = False
+        if data.nbytes > self.max_bytes:
+            return data
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= old.nbytes
+            self._entries[key] = data
+            self._nbytes += data.nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+                self.evictions += 1
+        return data
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_load(self, fpath, loader):
+        """
+        Return the cached frame for ``fpath``, decoding it with ``loader`` on a miss.
+        """
+        key = self.key(fpath)
+        data = self.get(key)
+        if data is None:
+            data = self.put(key, loader(fpath))
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "nbytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+            }
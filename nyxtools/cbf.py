@@ -0,0 +1,217 @@
+import logging
+
+import numpy as np
+from fabio import cbfimage
+
+logger = logging.getLogger(__name__)
+
+# Marks the start of the binary blob that follows the MIME header
+CBF_BINARY_STARTER = b"\x0c\x1a\x04\xd5"
+
+# Marks the start of the MIME header of the binary section
+CBF_BINARY_SECTION = b"--CIF-BINARY-FORMAT-SECTION--"
+
+# Pilatus mini-CBF header fields: positions of the values among the words of
+# the line (after the punctuation is blanked out) and their type
+PILATUS_HEADER_FIELDS = {
+    "Pixel_size": ((1, 4), float),
+    "Exposure_time": ((1,), float),
+    "Exposure_period": ((1,), float),
+    "Tau": ((1,), float),
+    "Count_cutoff": ((1,), int),
+    "Threshold_setting": ((1,), float),
+    "Gain_setting": ((1, 2), str),
+    "N_excluded_pixels": ((1,), int),
+    "Excluded_pixels": ((1,), str),
+    "Flat_field": ((1,), str),
+    "Trim_file": ((1,), str),
+    "Image_path": ((1,), str),
+    "Wavelength": ((1,), float),
+    "Energy_range": ((1, 2), float),
+    "Detector_distance": ((1,), float),
+    "Detector_Voffset": ((1,), float),
+    "Beam_xy": ((1, 2), float),
+    "Flux": ((1,), float),
+    "Filter_transmission": ((1,), float),
+    "Start_angle": ((1,), float),
+    "Angle_increment": ((1,), float),
+    "Detector_2theta": ((1,), float),
+    "Polarization": ((1,), float),
+    "Alpha": ((1,), float),
+    "Kappa": ((1,), float),
+    "Phi": ((1,), float),
+    "Phi_increment": ((1,), float),
+    "Chi": ((1,), float),
+    "Chi_increment": ((1,), float),
+    "Omega": ((1,), float),
+    "Omega_increment": ((1,), float),
+    "Oscillation_axis": ((1,), str),
+    "N_oscillations": ((1,), int),
+    "Start_position": ((1,), float),
+    "Position_increment": ((1,), float),
+    "Shutter_time": ((1,), float),
+}
+
+# Names the flyers use for Pilatus header fields
+PILATUS_HEADER_ALIASES = {
+    "omega": "Start_angle",
+}
+
+# Read size when looking for the end of the text header
+HEADER_CHUNK_SIZE = 4096
+
+HEADER_CONTENTS = b"_array_data.header_contents"
+_HEADER_PUNCTUATION = str.maketrans("#(),:=", "      ")
+HEADER_END = b"_array_data.data"
+
+
+class CbfDecodeError(RuntimeError):
+    """
+    Raised when the binary section of a CBF file cannot be located.
+    """
+
+
+def parse_binary_header(blob):
+    """
+    Locate the binary section of a CBF file and parse its MIME header.
+
+    Returns the MIME header as a dict of strings and the offset of the first
+    compressed byte in ``blob``.
+    """
+    start = blob.find(CBF_BINARY_STARTER)
+    if start < 0:
+        raise CbfDecodeError("No binary section found")
+    section = blob.rfind(CBF_BINARY_SECTION, 0, start)
+    if section < 0:
+        raise CbfDecodeError("No MIME header found for the binary section")
+
+    header = {}
+    for line in blob[section:start].splitlines()[1:]:
+        line = line.strip().rstrip(b";")
+        if not line:
+            continue
+        if b":" in line:
+            key, value = line.split(b":", 1)
+        elif b"=" in line:
+            key, value = line.split(b"=", 1)
+        else:
+            continue
+        header[key.strip().decode("ascii")] = value.strip(b' "\r\n\t').decode("ascii")
+    return header, start + len(CBF_BINARY_STARTER)
+
+
+def parse_pilatus_header(text):
+    """
+    Parse the lines of a Pilatus ``_array_data.header_contents`` block.
+
+    Returns a dict of typed values: a scalar for single-valued fields, a
+    tuple otherwise. ``Detector`` keeps the rest of its line as a string.
+    """
+    header = {}
+    lines = text.splitlines()
+    for line, words in zip(lines, text.translate(_HEADER_PUNCTUATION).splitlines()):
+        words = words.split()
+        if not words:
+            continue
+        if words[0] == "Detector":
+            header["Detector"] = line.split(":", 1)[-1].strip()
+            continue
+        field = PILATUS_HEADER_FIELDS.get(words[0])
+        if field is None:
+            continue
+        indices, kind = field
+        try:
+            values = tuple(kind(words[i]) for i in indices)
+        except (IndexError, ValueError):
+            logger.debug(f"Could not parse Pilatus header line: {line!r}")
+            continue
+        header[words[0]] = values[0] if len(values) == 1 else values
+    return header
+
+
+def read_cbf_header(fpath):
+    """
+    Read the Pilatus header of a CBF file without touching its binary section.
+
+    ``fpath`` is a path or a file opened in binary mode. Only the text header
+    at the start of the file is read, in chunks of HEADER_CHUNK_SIZE bytes.
+    """
+    if not hasattr(fpath, "read"):
+        with open(fpath, "rb") as f:
+            return read_cbf_header(f)
+
+    blob = b""
+    while HEADER_END not in blob and CBF_BINARY_SECTION not in blob:
+        chunk = fpath.read(HEADER_CHUNK_SIZE)
+        if not chunk:
+            break
+        blob += chunk
+
+    start = blob.find(HEADER_CONTENTS)
+    if start < 0:
+        return {}
+    # The block is delimited by lines holding a single semicolon
+    start = blob.find(b"\n;", start) + 2
+    end = blob.find(b"\n;", start)
+    if start < 2 or end < 0:
+        return {}
+    return parse_pilatus_header(blob[start:end].decode("ascii", errors="replace"))
+
+
+def read_cbf_shape(fpath):
+    """
+    Image shape (rows, columns) of a CBF file, read from its MIME header only.
+    """
+    blob = b""
+    with open(fpath, "rb") as f:
+        while CBF_BINARY_STARTER not in blob:
+            chunk = f.read(HEADER_CHUNK_SIZE)
+            if not chunk:
+                break
+            blob += chunk
+    header, _ = parse_binary_header(blob)
+    return (
+        int(header["X-Binary-Size-Second-Dimension"]),
+        int(header["X-Binary-Size-Fastest-Dimension"]),
+    )
+
+
+def compact_frame(data, dtype, out=None):
+    """
+    Copy an int32 Pilatus frame into a smaller integer dtype.
+
+    For uint16 the -1/-2 gap and bad-pixel sentinels become 0, so they have
+    to be kept in a separate mask (``data < 0``); only the maximum has to be
+    checked, in one pass. For int16 the sentinels are kept as they are.
+    Returns None, leaving ``out`` unspecified, when the values do not fit.
+    """
+    dtype = np.dtype(dtype)
+    if dtype == np.int32:
+        lo, hi = None, None
+    elif dtype == np.uint16:
+        lo, hi = None, data.max(initial=0)
+    elif dtype == np.int16:
+        lo, hi = data.min(initial=0), data.max(initial=0)
+    else:
+        raise ValueError(f"Unsupported compact dtype: {dtype}")
+    if (hi is not None and hi > np.iinfo(dtype).max) or (lo is not None and lo < np.iinfo(dtype).min):
+        return None
+
+    if out is None:
+        out = np.empty(data.shape, dtype=dtype)
+    if dtype == np.uint16:
+        np.maximum(data, 0, out=out, casting="unsafe")
+    else:
+        np.copyto(out, data, casting="unsafe")
+    return out
+
+
+def read_cbf(fpath, out=None):
+    """
+    Read the image of a Pilatus CBF file with fabio, into ``out`` if given.
+    """
+    data = cbfimage.CbfImage(fname=str(fpath)).data
+    if out is not None:
+        out[...] = data
+        return out
+    return data
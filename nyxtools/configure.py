@@ -0,0 +1,155 @@
+import functools
+import logging
+import math
+import numbers
+import operator
+import threading
+import time as ttime
+
+from ophyd.signal import EpicsSignalBase
+from ophyd.status import Status
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a batch of puts to complete
+DEFAULT_PUT_TIMEOUT = 10.0
+
+
+def put_status(signal, value):
+    """
+    Start a put and return a status that finishes when the put has completed.
+    """
+    if not isinstance(signal, EpicsSignalBase):
+        return signal.set(value)
+    # Complete on the EPICS put callback, as put(wait=True) does, rather than
+    # on the readback matching the setpoint as set() would
+    status = Status(obj=signal)
+    signal.put(value, use_complete=True, callback=lambda **kwargs: status.set_finished())
+    return status
+
+
+def _record_latency(latencies, name, start, status):
+    latencies[name] = ttime.monotonic() - start
+
+
+def put_many(puts, timeout=DEFAULT_PUT_TIMEOUT):
+    """
+    Write several signals at once and wait for all the writes to complete.
+
+    ``puts`` is a sequence of (signal, value) pairs. Every put is issued
+    before waiting on any of them, so the Channel Access round-trips overlap
+    instead of adding up; the puts still reach the IOC in the given order.
+    Raises ophyd's WaitTimeoutError if the combined status is not done
+    within ``timeout`` seconds. Returns the measured latency of each put in
+    seconds, by signal name.
+    """
+    start = ttime.monotonic()
+    latencies = {}
+    statuses = []
+    for signal, value in puts:
+        status = put_status(signal, value)
+        status.add_callback(functools.partial(_record_latency, latencies, signal.name, start))
+        statuses.append(status)
+    if statuses:
+        functools.reduce(operator.and_, statuses).wait(timeout)
+    logger.debug(f"put_many: {len(statuses)} puts in {ttime.monotonic() - start:.3f} s: {latencies}")
+    return latencies
+
+
+def _same(signal, cached, value):
+    if isinstance(cached, numbers.Real) and isinstance(value, numbers.Real):
+        tolerance = getattr(signal, "tolerance", None) or 0
+        return math.isclose(cached, value, rel_tol=1e-9, abs_tol=tolerance)
+    return cached == value
+
+
+class ConfigCache:
+    """
+    Write-through cache of the last confirmed value of configuration setpoints.
+
+    Puts made through the cache are skipped when the signal already holds the
+    requested value, and the values written are remembered once their puts
+    complete. Every signal is monitored from its first use, and an update
+    that disagrees with the cached value, made by another client or by an
+    IOC restart, drops it from the cache so the next put goes through.
+
+    Only pass configuration setpoints; command PVs, whose puts have side
+    effects however often they are repeated, must always be written.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.skipped = 0
+        self.invalidations = 0
+
+    def _watch(self, signal):
+        if signal not in self._tokens:
+            self._tokens[signal] = signal.subscribe(functools.partial(self._on_value, signal), run=False)
+
+    def _on_value(self, signal, value=None, **kwargs):
+        with self._lock:
+            if signal in self._values and not _same(signal, self._values[signal], value):
+                del self._values[signal]
+                self.invalidations += 1
+
+    def __contains__(self, signal):
+        with self._lock:
+            return signal in self._values
+
+    def put_many(self, puts, timeout=DEFAULT_PUT_TIMEOUT):
+        """
+        Like put_many, but only for the signals whose value would change.
+        """
+        pending = []
+        for signal, value in puts:
+            self._watch(signal)
+            with self._lock:
+                if signal in self._values and _same(signal, self._values[signal], value):
+                    self.skipped += 1
+                    continue
+            pending.append((signal, value))
+
+        # Monitor updates caused by these puts are not external changes
+        self.invalidate(*(signal for signal, _ in pending))
+        latencies = put_many(pending, timeout)
+        with self._lock:
+            for signal, value in pending:
+                self._values[signal] = value
+            self.writes += len(pending)
+        return latencies
+
+    def invalidate(self, *signals):
+        """
+        Forget the cached values of signals changed behind the cache's back.
+        """
+        with self._lock:
+            for signal in signals:
+                self._values.pop(signal, None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+        for signal, token in self._tokens.items():
+            signal.unsubscribe(token)
+        self._tokens.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "writes": self.writes,
+                "skipped": self.skipped,
+                "invalidations": self.invalidations,
+                "entries": len(self._values),
+            }
+
+
+def put_config(cache, puts, timeout=DEFAULT_PUT_TIMEOUT):
+    """
+    put_many through ``cache``, or straight to the signals when it is None.
+    """
+    if cache is None:
+        return put_many(puts, timeout)
+    return cache.put_many(puts, timeout)
@@ -1,21 +1,59 @@
 # import getpass
 # import grp
+import asyncio
+import functools
 import logging
-
-# import os
+import os
 import time as ttime
 from collections import deque
 
-import fabio
+import bluesky.plan_stubs as bps
 from event_model import compose_resource
 from mxtools.flyer import MXFlyer
 from ophyd.status import SubscriptionStatus
 
+from .cbf import PILATUS_HEADER_ALIASES, read_cbf_header
+from .configure import DEFAULT_PUT_TIMEOUT, put_config
+from .ready import wait_ready, zebra_armed
+from .sweep import FILENAME_TEMPLATE, SweepArray, verify_sweep
+from .watch import SweepWatcher
+
 logger = logging.getLogger(__name__)
 DEFAULT_DATUM_DICT = {"data": None, "omega": None}
+# Number of events built with one timestamp by datum_events
+EVENT_CHUNK_SIZE = 1000
+
+
+def datum_events(columns, chunk_size=EVENT_CHUNK_SIZE):
+    """
+    Partial events, for collect(), of columns of datum ids of equal length.
+
+    bluesky packs all the events of a collect() into one EventPage. Events
+    are built in chunks of chunk_size rows sharing one timestamp and one
+    timestamps and filled dict, leaving only the data dict to build per
+    frame. "filled" stays False so that Fillers load the frames.
+    """
+    keys = list(columns)
+    num_rows = len(next(iter(columns.values()), []))
+    for start in range(0, num_rows, chunk_size):
+        stop = min(start + chunk_size, num_rows)
+        now = ttime.time()
+        timestamps = dict.fromkeys(keys, now)
+        filled = dict.fromkeys(keys, False)
+        for row in zip(*(column[start:stop] for column in columns.values())):
+            yield {"data": dict(zip(keys, row)), "timestamps": timestamps, "time": now, "filled": filled}
 
 
 class NYXFlyer(MXFlyer):
+    # Optional nyxtools.configure.ConfigCache skipping setpoint puts that would
+    # not change anything
+    config_cache = None
+
+    # Upper bounds of the readiness waits, and the fixed delays used instead
+    # when ready_signals is False. The Zebra reset has no readiness signal and
+    # always waits its fixed delay
+    FALLBACK_DELAYS = {"zebra_reset": 2.0, "zebra_armed": 0.5}
+
     def __init__(self, vector, zebra, detector=None) -> None:
         self.name = "NYXFlyer"
         self.vector = vector
@@ -26,10 +64,31 @@ class NYXFlyer(MXFlyer):
         self.file_prefix = None
         self.num_images = None
         self.file_number_start = None
+        # One Resource + DatumPage for the whole sweep instead of one Resource
+        # and Datum per image
+        self.single_resource = False
+        # Emit documents for each frame as soon as its file is written, with
+        # the collect_while_acquiring plan between kickoff and complete
+        self.streaming = False
+        # Check the sweep is complete before emitting its documents, and point
+        # the resources at the manifest written for it
+        self.verify = False
+        # Seconds allowed for the detector parameter puts in detector_arm
+        self.put_timeout = DEFAULT_PUT_TIMEOUT
+        # Wait for the Zebra to report it is ready rather than for fixed delays
+        self.ready_signals = True
+        self.fallback_delays = dict(self.FALLBACK_DELAYS)
 
         self._asset_docs_cache = deque()
         self._resource_document = None
         self._datum_factory = None
+        self._datum_page_factory = None
+        self._resource_kwargs = {}
+        self._watcher = None
+        # Frames reported by wait_for_frames, not yet in asset documents
+        self._pending_frames = []
+        # Number of datum ids already emitted in events
+        self._num_collected = 0
 
         # self._resource_uids = []
         # self._datum_counter = None
@@ -45,17 +104,39 @@ class NYXFlyer(MXFlyer):
         self.file_prefix = kwargs.get("file_prefix", "test")
         self.num_images = kwargs.get("num_images", 1)
         self.file_number_start = kwargs.get("file_number_start", 1)
+        self.single_resource = kwargs.get("single_resource", False)
+        self.streaming = kwargs.get("streaming", False)
+        self.verify = kwargs.get("verify", False)
 
         super().update_parameters(**kwargs)
         self.zebra.pc.arm_signal.put(1)
 
     def kickoff(self):
         logger.debug(f"kickoff: flyer {self.name}")
-        ttime.sleep(0.5)
+        armed = zebra_armed(self.zebra) if self.ready_signals else None
+        wait_ready("zebra_armed", armed, self.fallback_delays["zebra_armed"])
         self.detector.stage()
+        if self.streaming:
+            self._start_watcher()
         st = self.vector.move()
         return st
 
+    def _start_watcher(self):
+        if self._watcher is not None:
+            self._watcher.close()
+        self._watcher = SweepWatcher(
+            self.data_directory_name,
+            self.file_prefix,
+            self.file_number_start,
+            self.num_images,
+            counter=self.detector.cam.array_counter,
+        )
+        self._datum_ids = []
+        self._pending_frames = []
+        self._num_collected = 0
+        self._datum_page_factory = None
+        self._resource_kwargs = {}
+
     def complete(self):
         logger.debug("complete: vector tracking")
         st_vector = self.vector.track_move()
@@ -99,41 +180,94 @@ class NYXFlyer(MXFlyer):
     def collect(self):
         logger.debug("collect: start")
 
-        self.unstage()
-
-        for datum_id in self._datum_ids:
-            now = ttime.time()
-            data = {
-                # f"{self.detector.name}_image": self._datum_ids["data"],
-                # "omega": self._datum_ids["omega"],
-                f"{self.detector.name}_image": datum_id
-            }
-            yield {
-                "data": data,
-                "timestamps": {key: now for key in data},
-                "time": now,
-                "filled": {key: False for key in data},
-            }
+        yield from datum_events({f"{self.detector.name}_image": self._take_datum_ids()})
         logger.debug("collect: done")
 
+    def _take_datum_ids(self):
+        """
+        Datum ids not yet emitted in events, unstaging once the sweep is over.
+        """
+        if not self.streaming:
+            self.unstage()
+            return list(self._datum_ids)
+
+        start = self._num_collected
+        datum_ids = self._datum_ids[start:]
+        self._num_collected = len(self._datum_ids)
+        if self._watcher.done and self._num_collected == self.num_images:
+            self._watcher.close()
+            self.unstage()
+        return datum_ids
+
+    @property
+    def collected_all(self):
+        """
+        True once the events of every frame of a streaming sweep have been collected.
+        """
+        return self._num_collected == self.num_images
+
+    def wait_for_frames(self, timeout=None):
+        """
+        Block until more frames of a streaming sweep are written, or ``timeout`` seconds have passed.
+
+        The frames are kept for the next collect_asset_docs(). Returns their number.
+        """
+        if self._watcher is None:
+            raise RuntimeError("wait_for_frames needs a streaming flyer that has been kicked off")
+        frames = self._watcher.wait(timeout)
+        self._pending_frames += frames
+        return len(frames)
+
     def collect_asset_docs(self):
         logger.debug("collect_asset_docs: start")
         # asset_docs_cache = []
 
         start_num = self.file_number_start
         end_num = self.file_number_start + self.num_images
+        if self.streaming:
+            # Only the frames written since the previous call
+            frames = self._pending_frames + self._watcher.poll()
+            self._pending_frames = []
+        else:
+            frames = range(start_num, end_num)
+            self._datum_page_factory = None
+            self._resource_kwargs = {}
+            if self.verify:
+                try:
+                    report = verify_sweep(
+                        self.data_directory_name, self.file_prefix, start_num, self.num_images, write_manifest=True
+                    )
+                except OSError as exc:
+                    # e.g. no write access to the data directory: the
+                    # handlers then check each file themselves
+                    logger.warning(
+                        f"collect_asset_docs: could not verify the sweep, continuing without a manifest: {exc}"
+                    )
+                else:
+                    if report["manifest"] is not None:
+                        self._resource_kwargs = {
+                            "manifest": report["manifest"],
+                            "manifest_mtime_ns": report["manifest_mtime_ns"],
+                        }
+
+        if self.single_resource:
+            yield from self._collect_sweep_asset_docs(start_num, end_num, frames)
+            return
+
         # ensure that the number format of resource_path below matches LSDC
         # daq_utils.create_filename and AreaDetector field FileTemplate
-        for img in range(start_num, end_num):
+        for img in frames:
             self._resource_document, self._datum_factory, _ = compose_resource(
                 start={"uid": "needed for compose_resource() but will be discarded"},
                 spec="AD_PILATUS_MX",
                 root=self.data_directory_name,
-                resource_path=f"{self.file_prefix}_{img:05d}.cbf",
-                resource_kwargs={},
+                resource_path=FILENAME_TEMPLATE.format(file_prefix=self.file_prefix, img=img),
+                resource_kwargs=dict(self._resource_kwargs),
             )
 
             self._resource_document.pop("run_start")
+            if img == start_num:
+                self._first_file = os.path.join(self.data_directory_name, self._resource_document["resource_path"])
             self._asset_docs_cache.append(("resource", self._resource_document))
 
             datum_document = self._datum_factory(datum_kwargs={})
@@ -207,9 +341,52 @@ class NYXFlyer(MXFlyer):
         #     asset_docs_cache.append(("datum", datum))
         # return tuple(asset_docs_cache)
 
+    def _collect_sweep_asset_docs(self, start_num, end_num, frames):
+        if self._datum_page_factory is None:
+            yield from self._compose_sweep_resource(start_num, end_num)
+        if not frames:
+            return
+
+        datum_page = self._datum_page_factory(datum_kwargs={"frame_num": list(frames)})
+        logger.debug(f"datum_page: {len(datum_page['datum_id'])} datums")
+        self._datum_ids.extend(datum_page["datum_id"])
+        yield ("datum_page", datum_page)
+
+    def _compose_sweep_resource(self, start_num, end_num):
+        resource_document, _, self._datum_page_factory = compose_resource(
+            start={"uid": "needed for compose_resource() but will be discarded"},
+            spec="AD_PILATUS_MX",
+            root=self.data_directory_name,
+            resource_path=self.file_prefix,
+            resource_kwargs={
+                "template": FILENAME_TEMPLATE,
+                "frame_start": start_num,
+                "num_images": end_num - start_num,
+                **self._resource_kwargs,
+            },
+        )
+        resource_document.pop("run_start")
+        self._first_file = os.path.join(
+            self.data_directory_name,
+            FILENAME_TEMPLATE.format(file_prefix=self.file_prefix, img=start_num),
+        )
+        yield ("resource", resource_document)
+
+    def sweep_array(self):
+        """
+        Lazy (num_images, Y, X) view over the images written by the last sweep.
+        """
+        return SweepArray.from_sweep(
+            self.data_directory_name,
+            self.file_prefix,
+            self.file_number_start,
+            self.num_images,
+        )
+
     def _extract_metadata(self, field="omega"):
-        with fabio.open(self._first_file, "r") as cbf:
-            return cbf.pilatus_headers("omega")
+        # Only the text header is read, the image itself is never decoded
+        header = read_cbf_header(self._first_file)
+        return header[PILATUS_HEADER_ALIASES.get(field, field)]
 
     def detector_arm(self, **kwargs):
         start = kwargs["angle_start"]
@@ -233,20 +410,28 @@ class NYXFlyer(MXFlyer):
         file_prefix_minus_directory = str(file_prefix)
         file_prefix_minus_directory = file_prefix_minus_directory.split("/")[-1]
 
-        self.detector.cam.acquire_time.put(exposure_period_per_image - 0.0024, wait=True)
-        self.detector.cam.acquire_period.put(exposure_period_per_image, wait=True)
-        self.detector.cam.num_images.put(num_images, wait=True)
-        # self.detector.cam.file_path.put(data_directory_name, wait=True)
-        # self.detector.cam.file_name.put(file_prefix_minus_directory, wait=True)
-
-        # originally from detector_set_fileheader
-        self.detector.cam.beam_x.put(x_beam, wait=True)
-        self.detector.cam.beam_y.put(y_beam, wait=True)
-        self.detector.cam.angle_incr.put(width, wait=True)
-        self.detector.cam.start_angle.put(start, wait=True)
-        self.detector.cam.wavelength.put(wavelength, wait=True)
-        self.detector.cam.det_dist.put(det_distance_m * 1000, wait=True)
-        self.detector.cam.filter_transm.put(transmission, wait=True)
+        cam = self.detector.cam
+        latencies = put_config(
+            self.config_cache,
+            [
+                (cam.acquire_time, exposure_period_per_image - 0.0024),
+                (cam.acquire_period, exposure_period_per_image),
+                (cam.num_images, num_images),
+                # (cam.file_path, data_directory_name),
+                # (cam.file_name, file_prefix_minus_directory),
+                # originally from detector_set_fileheader
+                (cam.beam_x, x_beam),
+                (cam.beam_y, y_beam),
+                (cam.angle_incr, width),
+                (cam.start_angle, start),
+                (cam.wavelength, wavelength),
+                (cam.det_dist, det_distance_m * 1000),
+                (cam.filter_transm, transmission),
+            ],
+            timeout=self.put_timeout,
+        )
+        logger.info(f"detector_arm: parameters set in {max(latencies.values(), default=0):.3f} s")
+        logger.debug(f"detector_arm: put latencies {latencies}")
 
         # Setting the file start number, etc.
         self.detector.file.file_path.put(self.data_directory_name)
@@ -299,9 +484,43 @@ class NYXFlyer(MXFlyer):
 
     def zebra_daq_prep(self):
         self.zebra.reset.put(1)
-        ttime.sleep(2.0)
-        self.zebra.out1.put(31)
+        # SYS_RESET only reports that the record processed, and the Zebra has
+        # no signal for being back up, so the reset keeps its fixed delay
+        wait_ready("zebra_reset", None, self.fallback_delays["zebra_reset"])
+        if self.config_cache is not None:
+            # The reset restored the defaults of these, whatever the cache holds
+            self.config_cache.invalidate(self.zebra.out1, self.zebra.pc.arm.trig_source)
+        put_config(self.config_cache, [(self.zebra.out1, 31)])
         self.zebra.m1_set_pos.put(1)
         self.zebra.m2_set_pos.put(1)
         self.zebra.m3_set_pos.put(1)
-        self.zebra.pc.arm.trig_source.put(0)  # Soft triggering for NYX
+        put_config(self.config_cache, [(self.zebra.pc.arm.trig_source, 0)])  # Soft triggering for NYX
+
+
+def _in_thread(func, *args):
+    """
+    Run ``func(*args)`` in the default executor of the running event loop.
+
+    A future factory for bps.wait_for; asyncio.to_thread needs Python 3.9.
+    """
+    return asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+def collect_while_acquiring(flyer, timeout=1.0, stall_timeout=60.0):
+    """
+    Plan emitting the documents of a streaming NYXFlyer as the frames are written.
+
+    Run it between kickoff and complete. Each pass blocks, off the RunEngine
+    event loop, until the flyer's SweepWatcher reports new frames or
+    ``timeout`` seconds pass, and collects the new frames. Returns once
+    every frame has been collected, and raises TimeoutError if no new frame
+    comes for ``stall_timeout`` seconds.
+    """
+    last_frame = ttime.monotonic()
+    while not flyer.collected_all:
+        (task,) = yield from bps.wait_for([functools.partial(_in_thread, flyer.wait_for_frames, timeout)])
+        if task.result():
+            last_frame = ttime.monotonic()
+            yield from bps.collect(flyer)
+        elif ttime.monotonic() - last_frame > stall_timeout:
+            raise TimeoutError(f"collect_while_acquiring: no new frame in {stall_timeout} s")
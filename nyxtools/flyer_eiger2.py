@@ -1,17 +1,28 @@
 import logging
-import time as ttime
 
 from mxtools.flyer import MXFlyer
 from ophyd.status import SubscriptionStatus
 
+from .configure import put_config
+from .flyer import datum_events
+from .ready import wait_ready, zebra_armed
+
 logger = logging.getLogger(__name__)
 DEFAULT_DATUM_DICT = {"data": None, "omega": None}
 
 
 class NYXEiger2Flyer(MXFlyer):
+    # Optional nyxtools.configure.ConfigCache, as for NYXFlyer
+    config_cache = None
+
+    # As for NYXFlyer
+    FALLBACK_DELAYS = {"zebra_reset": 2.0, "zebra_armed": 1.0}
+
     def __init__(self, vector, zebra, detector=None) -> None:
         super().__init__(vector, zebra, detector)
         self.name = "NYXEiger2Flyer"
+        self.ready_signals = True
+        self.fallback_delays = dict(self.FALLBACK_DELAYS)
 
     def kickoff(self):
         self.detector.stage()
@@ -21,7 +32,8 @@ class NYXEiger2Flyer(MXFlyer):
     def update_parameters(self, **kwargs):
         super().update_parameters(**kwargs)
         self.zebra.pc.arm_signal.put(1)
-        ttime.sleep(1)
+        armed = zebra_armed(self.zebra) if self.ready_signals else None
+        wait_ready("zebra_armed", armed, self.fallback_delays["zebra_armed"])
 
     def complete(self):
         st_vector = self.vector.track_move()
@@ -40,6 +52,14 @@ class NYXEiger2Flyer(MXFlyer):
 
         return st_vector & st_detector
 
+    def collect(self):
+        self.unstage()
+
+        self._master_metadata = self._extract_metadata()
+        data = {f"{self.detector.name}_image": self._datum_ids["data"], "omega": self._datum_ids["omega"]}
+        # The whole sweep is a single event, of the master file datums
+        yield from datum_events({key: [datum_id] for key, datum_id in data.items()})
+
     def detector_arm(self, **kwargs):
         logger.debug("flyer detector arm")
         super().detector_arm(**kwargs)
@@ -73,9 +93,14 @@ class NYXEiger2Flyer(MXFlyer):
 
     def zebra_daq_prep(self):
         self.zebra.reset.put(1)
-        ttime.sleep(2.0)
-        self.zebra.out1.put(31)
+        # SYS_RESET only reports that the record processed, and the Zebra has
+        # no signal for being back up, so the reset keeps its fixed delay
+        wait_ready("zebra_reset", None, self.fallback_delays["zebra_reset"])
+        if self.config_cache is not None:
+            # The reset restored the defaults of these, whatever the cache holds
+            self.config_cache.invalidate(self.zebra.out1, self.zebra.pc.arm.trig_source)
+        put_config(self.config_cache, [(self.zebra.out1, 31)])
         self.zebra.m1_set_pos.put(1)
         self.zebra.m2_set_pos.put(1)
         self.zebra.m3_set_pos.put(1)
-        self.zebra.pc.arm.trig_source.put(0)  # Soft triggering for NYX
+        put_config(self.config_cache, [(self.zebra.pc.arm.trig_source, 0)])  # Soft triggering for NYX
@@ -1,8 +1,25 @@
 import logging
 import pathlib
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 
+import numpy as np
 from area_detector_handlers import HandlerBase
-from fabio import cbfimage
+
+from .cbf import (
+    PILATUS_HEADER_ALIASES,
+    compact_frame,
+    read_cbf,
+    read_cbf_header,
+    read_cbf_shape,
+)
+from .mask import frame_mask, masked_frame
+from .sweep import manifest_files, sweep_paths
 
 logger = logging.getLogger(__name__)
 
@@ -10,29 +27,290 @@ logger = logging.getLogger(__name__)
 class PilatusHandlerMX(HandlerBase):
     spec = "AD_PILATUS_MX"
 
-    def __init__(self, fpath):
+    # Process-wide decoded-frame cache, disabled unless set to a FrameCache:
+    #   PilatusHandlerMX.frame_cache = FrameCache(max_bytes=4 * 1024**3)
+    frame_cache = None
+
+    # Opt-in sequential read-ahead into frame_cache:
+    #   PilatusHandlerMX.prefetcher = Prefetcher(PilatusHandlerMX.frame_cache)
+    prefetcher = None
+
+    def __init__(
+        self,
+        fpath,
+        template=None,
+        frame_start=None,
+        num_images=None,
+        dtype=None,
+        masked=False,
+        manifest=None,
+        manifest_mtime_ns=None,
+    ):
         # self._seq_id = seq_id
         self._fpath = pathlib.Path(f"{fpath}").absolute()
-        if not self._fpath.is_file():
-            raise RuntimeError(f"File {self._fpath} does not exist")
+        # With a template, one resource covers a whole sweep: fpath is the
+        # file prefix and each datum picks its frame with frame_num
+        self._template = template
+        self._frame_start = frame_start
+        self._num_images = num_images
+        if template is None:
+            if not self._in_manifest(manifest, manifest_mtime_ns) and not self._fpath.is_file():
+                raise RuntimeError(f"File {self._fpath} does not exist")
+        elif manifest is None and not self._fpath.parent.is_dir():
+            raise RuntimeError(f"Directory {self._fpath.parent} does not exist")
+        self._headers = {}
+        # Compact output dtype: int16, or uint16 with gaps and bad pixels in bit_mask
+        self._dtype = None if dtype is None else np.dtype(dtype)
+        # Return "data" as a numpy.ma view masking gaps and bad pixels
+        self._masked = masked
+
+    def _in_manifest(self, manifest, mtime_ns=None):
+        # A sweep verified by verify_sweep saves checking each of its files;
+        # with the mtime of its manifest, without a single stat
+        if manifest is None:
+            return False
+        try:
+            return self._fpath.name in manifest_files(manifest, mtime_ns)
+        except OSError:
+            logger.debug(f"Cannot read manifest {manifest}, checking {self._fpath}")
+            return False
+
+    def __call__(self, data_key="data", frame_num=None):
+        if data_key == "data":
+            if self._masked:
+                return masked_frame(*self.data_and_mask(frame_num))
+            return self._data(self._frame(frame_num))
+
+        elif data_key == "bit_mask":
+            # Module gaps (-1) and bad pixels (-2)
+            return frame_mask(self._frame(frame_num))
+
+        # Everything else comes from the text header only
+        header = self.header(frame_num)
+        if data_key == "header":
+            return header
+
+        data_key = PILATUS_HEADER_ALIASES.get(data_key, data_key)
+        if data_key in header:
+            return header[data_key]
+
+        raise RuntimeError(f"Unknown key: {data_key}")
+
+    def frame_path(self, frame_num=None):
+        """
+        Path of the CBF file holding ``frame_num``.
+        """
+        if self._template is None:
+            return self._fpath
+        if frame_num is None:
+            raise RuntimeError(f"frame_num is needed to read from the sweep {self._fpath}")
+        if self._frame_start is not None and self._num_images is not None:
+            if not self._frame_start <= frame_num < self._frame_start + self._num_images:
+                raise RuntimeError(f"Frame {frame_num} is not part of the sweep {self._fpath}")
+        return self._fpath.parent / self._template.format(file_prefix=self._fpath.name, img=frame_num)
+
+    def get_file_list(self, datum_kwarg_gen):
+        return [str(self.frame_path(kwargs.get("frame_num"))) for kwargs in datum_kwarg_gen]
+
+    def data_and_mask(self, frame_num=None):
+        """
+        The frame and its mask of module gaps and bad pixels, from a single decode.
+        """
+        frame = self._frame(frame_num)
+        return self._data(frame), frame_mask(frame)
+
+    def _data(self, frame):
+        if self._dtype is None:
+            return frame
+        data = compact_frame(frame, self._dtype)
+        if data is None:
+            logger.debug(f"Frame does not fit in {self._dtype}, returning int32")
+            return frame
+        return data
+
+    def _frame(self, frame_num=None):
+        fpath = self.frame_path(frame_num)
+        if self.prefetcher is not None:
+            self.prefetcher.notify(fpath)
+        if self.frame_cache is None:
+            return read_cbf(fpath)
+        return self.frame_cache.get_or_load(fpath, read_cbf)
+
+    def header(self, frame_num=None):
+        """
+        Typed Pilatus header fields of the frame, without decoding the image.
+        """
+        fpath = self.frame_path(frame_num)
+        if fpath not in self._headers:
+            self._headers[fpath] = read_cbf_header(fpath)
+        return self._headers[fpath]
+
+
+# Shared memory blocks attached by a process-pool worker, by name
+_worker_shared_memory = {}
+
+
+def _attach_shared_memory(name):
+    from multiprocessing import shared_memory
+
+    shm = _worker_shared_memory.get(name)
+    if shm is None:
+        # Workers share the parent's resource tracker, which unlinks the
+        # block only once the parent does
+        shm = shared_memory.SharedMemory(name=name)
+        _worker_shared_memory[name] = shm
+    return shm
+
+
+def _decode_into_slot(name, slots_shape, slot, fpath):
+    shm = _attach_shared_memory(name)
+    slots = np.ndarray(slots_shape, dtype=np.int32, buffer=shm.buf)
+    read_cbf(fpath, out=slots[slot])
+    return slot
+
+
+def _read_frames_in_processes(fpaths, indices, store, frame_shape, max_workers):
+    """
+    Decode frames in a process pool, passing them back through shared memory.
+
+    Workers decode into a ring of frame-sized slots in one shared memory
+    block, so no frame is ever pickled; the parent hands each finished slot
+    to ``store`` and then reuses it for the next frame.
+    """
+    # Imported here as it needs Python 3.8, and only process reads use it
+    from multiprocessing import shared_memory
+
+    slots_shape = (2 * max_workers, *frame_shape)
+    nbytes = int(np.prod(slots_shape)) * np.dtype(np.int32).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+    try:
+        slots = np.ndarray(slots_shape, dtype=np.int32, buffer=shm.buf)
+        free = list(range(slots_shape[0]))
+        pending = {}
+        todo = iter(indices)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                for i in todo:
+                    slot = free.pop()
+                    future = executor.submit(_decode_into_slot, shm.name, slots_shape, slot, str(fpaths[i]))
+                    pending[future] = i
+                    if not free:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    slot = future.result()
+                    store(pending.pop(future), slots[slot])
+                    free.append(slot)
+        del slots
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def read_frames(fpaths, out=None, max_workers=4, use_processes=False, dtype=None, mask=None):
+    """
+    Decode many Pilatus CBF frames straight into one (N, Y, X) array.
+
+    The array is allocated once from the shape in the first file's header,
+    or ``out`` is filled instead. Frames are decoded by ``max_workers``
+    threads, each directly into its slice of the array; frames already in
+    PilatusHandlerMX.frame_cache are copied from there. With
+    ``use_processes`` the frames are decoded in a process pool instead, which
+    scales past the GIL on many-core machines; this needs Python 3.8.
+
+    ``dtype`` (or the dtype of ``out``) may be int16 or uint16 instead of
+    int32, see compact_frame. If a frame does not fit, the whole stack is
+    promoted to int32, or ValueError is raised when ``out`` was given.
+
+    A boolean ``mask`` of the same shape is filled with the gap and bad
+    pixel mask of each frame, see mask.frame_mask.
+    """
+    fpaths = [pathlib.Path(f"{fpath}").absolute() for fpath in fpaths]
+    if out is None:
+        shape = read_cbf_shape(fpaths[0]) if fpaths else (0, 0)
+        out = np.empty((len(fpaths), *shape), dtype=np.int32 if dtype is None else dtype)
+        promote = out.dtype != np.int32
+    elif out.shape[0] != len(fpaths):
+        raise ValueError(f"out holds {out.shape[0]} frames, {len(fpaths)} requested")
+    else:
+        promote = False
+
+    overflow = []
+
+    if mask is not None and mask.shape != out.shape:
+        raise ValueError(f"mask must have the shape {out.shape}")
+
+    def store(i, frame):
+        if mask is not None:
+            frame_mask(frame, out=mask[i])
+        if out.dtype == np.int32:
+            out[i] = frame
+        elif compact_frame(frame, out.dtype, out=out[i]) is None:
+            overflow.append(i)
+
+    # int32 frames are decoded in place, compact ones through a per-thread buffer
+    scratch = threading.local()
 
-    def __call__(self):
-        self._file = cbfimage.CbfImage(fname=self._fpath)
-        return self._file.data
+    def decode(i):
+        if out.dtype == np.int32:
+            read_cbf(fpaths[i], out=out[i])
+            if mask is not None:
+                frame_mask(out[i], out=mask[i])
+            return
+        if not hasattr(scratch, "frame"):
+            scratch.frame = np.empty(out.shape[1:], dtype=np.int32)
+        store(i, read_cbf(fpaths[i], out=scratch.frame))
 
-        # if data_key == "data":
-        #     return self._file.BINARY_SECTION
+    cache = PilatusHandlerMX.frame_cache
+    todo = []
+    for i, fpath in enumerate(fpaths):
+        data = None if cache is None else cache.get(cache.key(fpath))
+        if data is None:
+            todo.append(i)
+        else:
+            store(i, data)
 
-        # elif data_key == "omega":
-        #     return self._file.PilatusHeader["Start_angle"]
+    if use_processes and len(todo) > 1:
+        _read_frames_in_processes(fpaths, todo, store, out.shape[1:], max_workers)
+    elif max_workers <= 1:
+        for i in todo:
+            decode(i)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(decode, todo))
 
-        # elif data_key == "bit_mask":
-        #     ...
-        #     # code to pull out bit mask
-        #     raise NotImplementedError()
+    if overflow:
+        if not promote:
+            raise ValueError(
+                f"{len(overflow)} frames do not fit in {out.dtype}, starting with {fpaths[overflow[0]]}"
+            )
+        logger.debug(f"{len(overflow)} frames do not fit in {out.dtype}, promoting to int32")
+        return read_frames(fpaths, max_workers=max_workers, use_processes=use_processes, mask=mask)
+    return out
 
-        # elif data_key in self._file.PilatusHeader:
-        #     return self._file.PilatusHeader[data_key]
 
-        # else:
-        #     raise RuntimeError(f"Unknown key: {data_key}")
+def read_sweep(
+    data_directory_name,
+    file_prefix,
+    file_number_start,
+    num_images,
+    out=None,
+    max_workers=4,
+    use_processes=False,
+    dtype=None,
+    mask=None,
+):
+    """
+    Decode a range of frames of a sweep into one (N, Y, X) array, see read_frames.
+    """
+    fpaths = sweep_paths(data_directory_name, file_prefix, file_number_start, num_images)
+    return read_frames(
+        fpaths,
+        out=out,
+        max_workers=max_workers,
+        use_processes=use_processes,
+        dtype=dtype,
+        mask=mask,
+    )
@@ -0,0 +1,49 @@
+import functools
+
+import numpy as np
+
+# Size of one Pilatus module (rows, columns) and of the gaps between modules
+PILATUS_MODULE_SHAPE = (195, 487)
+PILATUS_GAP_SHAPE = (17, 7)
+
+
+@functools.lru_cache(maxsize=None)
+def gap_mask(shape):
+    """
+    Static mask of the inter-module gaps of a Pilatus detector.
+
+    ``shape`` is (array_size_y, array_size_x). The mask is computed once per
+    geometry and shared, so it is read-only. A shape that is not a whole
+    grid of modules has no known gaps.
+    """
+    masks = []
+    for size, module, gap in zip(shape, PILATUS_MODULE_SHAPE, PILATUS_GAP_SHAPE):
+        pitch = module + gap
+        if (size + gap) % pitch:
+            masks.append(np.zeros(size, dtype=bool))
+        else:
+            masks.append(np.arange(size) % pitch >= module)
+    mask = masks[0][:, None] | masks[1][None, :]
+    mask.flags.writeable = False
+    return mask
+
+
+def frame_mask(data, out=None):
+    """
+    Mask of the pixels of an int32 Pilatus frame that hold no counts.
+
+    The static gap mask is combined with the pixels marked negative in the
+    frame itself (-1 gaps, -2 bad pixels).
+    """
+    out = np.less(data, 0, out=out)
+    out |= gap_mask(data.shape)
+    return out
+
+
+def masked_frame(data, mask=None):
+    """
+    numpy.ma view of a Pilatus frame; the data is not copied.
+    """
+    if mask is None:
+        mask = frame_mask(data)
+    return np.ma.MaskedArray(data, mask=mask, copy=False)
@@ -0,0 +1,141 @@
+import logging
+import os
+import queue
+import threading
+
+from .cbf import read_cbf
+from .sweep import FILENAME_TEMPLATE, parse_sweep_path
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Sequential read-ahead of sweep frames into a FrameCache.
+
+    Every frame request is reported with ``notify``. Once two consecutive
+    frames of the same sweep have been requested, the following ``depth``
+    frames are decoded into the cache by a background thread. The depth
+    doubles on every further sequential request, up to ``max_depth``, and
+    drops back to ``min_depth`` when the access pattern turns random, at
+    which point frames still queued are cancelled. Asking for the same frame
+    again leaves both the depth and the queued frames alone.
+    """
+
+    def __init__(self, cache, min_depth=2, max_depth=16, loader=read_cbf):
+        self.cache = cache
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.loader = loader
+        self.depth = min_depth
+
+        self.issued = 0
+        self.completed = 0
+        self.cancelled = 0
+
+        self._last = None
+        self._generation = 0
+        self._scheduled = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="nyxtools-prefetch", daemon=True)
+        self._thread.start()
+
+    def notify(self, fpath, timeout=None):
+        """
+        Report a request for ``fpath`` and schedule read-ahead.
+
+        If ``fpath`` is being prefetched right now, wait for it to land in
+        the cache rather than decoding it a second time.
+        """
+        fpath = os.path.abspath(fpath)
+        parsed = parse_sweep_path(fpath)
+
+        with self._lock:
+            # The same frame again, e.g. its data then its mask, is neither
+            # sequential nor random: the read-ahead is left as it is
+            repeated = parsed is not None and parsed == self._last
+            sequential = (
+                parsed is not None
+                and self._last is not None
+                and parsed[:2] == self._last[:2]
+                and parsed[2] == self._last[2] + 1
+            )
+            if not sequential and not repeated:
+                self._cancel()
+                self.depth = self.min_depth
+            self._last = parsed
+
+            pending = self._scheduled.get(fpath)
+            if sequential:
+                directory, file_prefix, img = parsed
+                for next_img in range(img + 1, img + 1 + self.depth):
+                    fname = FILENAME_TEMPLATE.format(file_prefix=file_prefix, img=next_img)
+                    self._schedule(os.path.join(directory, fname))
+                self.depth = min(2 * self.depth, self.max_depth)
+
+        if pending is not None:
+            pending.wait(timeout)
+
+    def _schedule(self, fpath):
+        if fpath in self._scheduled:
+            return
+        done = threading.Event()
+        self._scheduled[fpath] = done
+        self._queue.put((self._generation, fpath, done))
+        self.issued += 1
+
+    def _cancel(self):
+        self._generation += 1
+        self.cancelled += len(self._scheduled)
+        for done in self._scheduled.values():
+            done.set()
+        self._scheduled.clear()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            generation, fpath, done = item
+            try:
+                if generation != self._generation:
+                    continue
+                key = self.cache.key(fpath)
+                if key not in self.cache:
+                    self.cache.put(key, self.loader(fpath))
+                    self.completed += 1
+            except FileNotFoundError:
+                # Read-ahead past the end of the sweep, or not written yet
+                pass
+            except Exception as exc:
+                logger.debug(f"Prefetch of {fpath} failed: {exc}")
+            finally:
+                done.set()
+                with self._lock:
+                    if self._scheduled.get(fpath) is done:
+                        del self._scheduled[fpath]
+                self._queue.task_done()
+
+    def join(self):
+        """
+        Block until all scheduled read-ahead has been processed.
+        """
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": self.depth,
+                "issued": self.issued,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "pending": len(self._scheduled),
+            }
+
+    def close(self):
+        with self._lock:
+            self._cancel()
+        self._queue.put(None)
+        self._thread.join()
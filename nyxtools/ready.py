@@ -0,0 +1,79 @@
+import logging
+import threading
+import time as ttime
+
+from ophyd.status import SubscriptionStatus
+from ophyd.utils import InvalidState, WaitTimeoutError
+
+logger = logging.getLogger(__name__)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record_wait(name, elapsed, ready):
+    """
+    Add a wait of ``elapsed`` seconds to the stats; ``ready`` is False for a timeout.
+    """
+    with _stats_lock:
+        stats = _stats.setdefault(name, {"count": 0, "timeouts": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+        stats["count"] += 1
+        stats["timeouts"] += ready is False
+        stats["total"] += elapsed
+        stats["max"] = max(stats["max"], elapsed)
+        stats["last"] = elapsed
+
+
+def ready_stats():
+    """
+    Summary of the readiness waits by name, in seconds, to tune the fallback delays.
+    """
+    with _stats_lock:
+        return {name: dict(stats, mean=stats["total"] / stats["count"]) for name, stats in _stats.items()}
+
+
+def reset_ready_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def wait_ready(name, status, fallback_delay):
+    """
+    Wait for ``status`` to report that a device is ready, for at most ``fallback_delay`` seconds.
+
+    Without a status, for hardware that cannot report its readiness, sleep
+    for ``fallback_delay`` instead. Readiness that does not come in time is
+    logged and the caller carries on, as it did after the fixed delay.
+    Returns the time waited.
+    """
+    start = ttime.monotonic()
+    ready = None
+    if status is None:
+        ttime.sleep(fallback_delay)
+    else:
+        try:
+            status.wait(fallback_delay)
+            ready = True
+        except WaitTimeoutError:
+            ready = False
+            logger.warning(f"{name}: not ready after {fallback_delay} s, carrying on")
+            try:
+                # Drop the subscription behind a readiness that never came
+                status.set_exception(TimeoutError(f"{name} not ready after {fallback_delay} s"))
+            except InvalidState:
+                pass
+    elapsed = ttime.monotonic() - start
+    logger.debug(f"{name}: waited {elapsed:.3f} s")
+    record_wait(name, elapsed, ready)
+    return elapsed
+
+
+def zebra_armed(zebra):
+    """
+    Status finishing once the soft-triggered Zebra position compare is armed.
+    """
+
+    def armed_callback(value, **kwargs):
+        return int(value) == 1
+
+    return SubscriptionStatus(zebra.pc.arm.output, armed_callback, run=True)
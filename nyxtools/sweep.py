@@ -0,0 +1,265 @@
+import functools
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .cbf import read_cbf, read_cbf_header, read_cbf_shape
+
+logger = logging.getLogger(__name__)
+
+# Must match the resource_path written by NYXFlyer.collect_asset_docs, LSDC
+# daq_utils.create_filename and the AreaDetector FileTemplate
+FILENAME_TEMPLATE = "{file_prefix}_{img:05d}.cbf"
+FILENAME_PATTERN = re.compile(r"^(?P<file_prefix>.*)_(?P<img>\d{5})\.cbf$")
+
+# Written next to a verified sweep, listing its files and their sizes
+MANIFEST_TEMPLATE = "{file_prefix}_manifest.json"
+
+# Header fields of a sweep table, named after the detector_arm parameters
+# that end up in them, with the Pilatus header key each one comes from.
+SWEEP_HEADER_FIELDS = {
+    "start_angle": "Start_angle",
+    "angle_incr": "Angle_increment",
+    "exposure_time": "Exposure_time",
+    "exposure_period": "Exposure_period",
+    "wavelength": "Wavelength",
+    # Detector distance in m, as written in the header
+    "det_dist": "Detector_distance",
+    "beam_x": ("Beam_xy", 0),
+    "beam_y": ("Beam_xy", 1),
+    "filter_transm": "Filter_transmission",
+}
+
+SWEEP_HEADER_DTYPE = np.dtype(
+    [("frame", np.int64)]
+    + [(name, np.float64) for name in SWEEP_HEADER_FIELDS]
+    + [("size", np.int64), ("mtime", np.float64)]
+)
+
+
+def sweep_paths(data_directory_name, file_prefix, file_number_start, num_images):
+    """
+    Paths of the CBF files of a sweep, in frame order.
+    """
+    return [
+        os.path.join(data_directory_name, FILENAME_TEMPLATE.format(file_prefix=file_prefix, img=img))
+        for img in range(file_number_start, file_number_start + num_images)
+    ]
+
+
+def _read_headers(paths):
+    rows = []
+    for fpath in paths:
+        try:
+            with open(fpath, "rb") as f:
+                stat = os.fstat(f.fileno())
+                header = read_cbf_header(f)
+        except FileNotFoundError:
+            logger.debug(f"read_sweep_headers: {fpath} is missing")
+            rows.append(None)
+            continue
+        values = []
+        for key in SWEEP_HEADER_FIELDS.values():
+            key, index = key if isinstance(key, tuple) else (key, None)
+            value = header.get(key, np.nan)
+            values.append(value if index is None or value is np.nan else value[index])
+        rows.append((stat.st_size, stat.st_mtime, values))
+    return rows
+
+
+def parse_sweep_path(fpath):
+    """
+    Split the path of a sweep frame into (directory, file_prefix, img).
+
+    Returns None for paths that do not follow FILENAME_TEMPLATE.
+    """
+    directory, fname = os.path.split(os.fspath(fpath))
+    match = FILENAME_PATTERN.match(fname)
+    if match is None:
+        return None
+    return directory, match["file_prefix"], int(match["img"])
+
+
+def read_sweep_headers(data_directory_name, file_prefix, file_number_start, num_images, max_workers=16):
+    """
+    Collect the Pilatus headers of a whole sweep into one structured array.
+
+    There is one row per frame with the header fields of SWEEP_HEADER_FIELDS
+    plus the file size and mtime. Only the text header of each file is read;
+    the frames are split into one contiguous block per worker thread. Frames
+    whose file is missing have a size of -1 and NaN everywhere else.
+    """
+    table = np.zeros(num_images, dtype=SWEEP_HEADER_DTYPE)
+    table["frame"] = np.arange(file_number_start, file_number_start + num_images)
+    table["size"] = -1
+    table["mtime"] = np.nan
+    for name in SWEEP_HEADER_FIELDS:
+        table[name] = np.nan
+
+    paths = sweep_paths(data_directory_name, file_prefix, file_number_start, num_images)
+    # Consecutive frames go to the same worker, which suits sequential reads
+    blocks = np.array_split(np.arange(num_images), max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_read_headers, ([paths[i] for i in block] for block in blocks)))
+
+    for block, rows in zip(blocks, results):
+        for i, row in zip(block, rows):
+            if row is not None:
+                size, mtime, values = row
+                table[i] = (table["frame"][i], *values, size, mtime)
+    return table
+
+
+def verify_sweep(
+    data_directory_name, file_prefix, file_number_start, num_images, min_size=None, write_manifest=False
+):
+    """
+    Check that every CBF file of a sweep exists and is not truncated.
+
+    The data directory is listed once with os.scandir rather than looking up
+    each frame by name, so missing frames cost nothing; the size of each
+    file found still takes one stat call. Frames smaller than ``min_size``
+    bytes, by default half the median size of the sweep, count as truncated.
+
+    Returns a dict with the sorted ``missing`` and ``truncated`` frame numbers,
+    the ``sizes`` of the files found by frame number, and the ``manifest``
+    path and its ``manifest_mtime_ns``. With ``write_manifest`` a complete
+    sweep gets a MANIFEST_TEMPLATE file, which PilatusHandlerMX accepts in
+    place of checking each file itself.
+    """
+    end_num = file_number_start + num_images
+    sizes = {}
+    with os.scandir(data_directory_name) as entries:
+        for entry in entries:
+            match = FILENAME_PATTERN.match(entry.name)
+            if match is None or match["file_prefix"] != file_prefix:
+                continue
+            img = int(match["img"])
+            if file_number_start <= img < end_num and entry.is_file():
+                sizes[img] = entry.stat().st_size
+
+    missing = sorted(set(range(file_number_start, end_num)) - sizes.keys())
+    if min_size is None:
+        min_size = np.median(list(sizes.values())) / 2 if sizes else 0
+    truncated = sorted(img for img, size in sizes.items() if size < min_size)
+
+    manifest = manifest_mtime_ns = None
+    if missing or truncated:
+        logger.warning(
+            f"verify_sweep: {file_prefix} has {len(missing)} missing and {len(truncated)} truncated frames"
+        )
+    elif write_manifest:
+        manifest = os.path.join(data_directory_name, MANIFEST_TEMPLATE.format(file_prefix=file_prefix))
+        files = {FILENAME_TEMPLATE.format(file_prefix=file_prefix, img=img): sizes[img] for img in sorted(sizes)}
+        with open(manifest, "w") as f:
+            json.dump(
+                {
+                    "file_prefix": file_prefix,
+                    "file_number_start": file_number_start,
+                    "num_images": num_images,
+                    "files": files,
+                },
+                f,
+            )
+        manifest_mtime_ns = os.stat(manifest).st_mtime_ns
+    return {
+        "missing": missing,
+        "truncated": truncated,
+        "sizes": sizes,
+        "manifest": manifest,
+        "manifest_mtime_ns": manifest_mtime_ns,
+    }
+
+
+def manifest_files(manifest, mtime_ns=None):
+    """
+    Names of the files listed in a sweep manifest written by verify_sweep.
+
+    Manifests are cached by path and modification time, so a manifest
+    rewritten for a sweep collected again under the same prefix is re-read.
+    ``mtime_ns`` is the manifest_mtime_ns reported by verify_sweep; without
+    it the manifest is stat'ed to find its modification time.
+    """
+    if mtime_ns is None:
+        mtime_ns = os.stat(manifest).st_mtime_ns
+    return _read_manifest_files(os.fspath(manifest), mtime_ns)
+
+
+@functools.lru_cache(maxsize=64)
+def _read_manifest_files(manifest, mtime_ns):
+    with open(manifest) as f:
+        return frozenset(json.load(f)["files"])
+
+
+class SweepArray:
+    """
+    Lazy (N, Y, X) view over the CBF files of a sweep.
+
+    Supports NumPy-style indexing; only the frames that are indexed are
+    decoded, one at a time, and only the selected rows and columns of each
+    are kept. ``to_dask`` wraps it in a dask array with one chunk per frame.
+    """
+
+    dtype = np.dtype(np.int32)
+    ndim = 3
+
+    def __init__(self, fpaths, frame_shape=None):
+        self.fpaths = [os.path.abspath(fpath) for fpath in fpaths]
+        if frame_shape is None:
+            frame_shape = read_cbf_shape(self.fpaths[0]) if self.fpaths else (0, 0)
+        self.shape = (len(self.fpaths), *frame_shape)
+
+    @classmethod
+    def from_sweep(cls, data_directory_name, file_prefix, file_number_start, num_images, frame_shape=None):
+        return cls(sweep_paths(data_directory_name, file_prefix, file_number_start, num_images), frame_shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"{type(self).__name__}(shape={self.shape}, dtype={self.dtype})"
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is None for k in key):
+            raise IndexError(f"{type(self).__name__} does not support np.newaxis")
+        if Ellipsis in key:
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i:][1:]
+        if len(key) > self.ndim:
+            raise IndexError(f"too many indices for a {self.ndim}-dimensional array")
+        frame_key, rest = key[0], key[1:]
+
+        if isinstance(frame_key, (int, np.integer)):
+            return read_cbf(self.fpaths[np.arange(len(self))[frame_key]])[rest]
+
+        frames = np.arange(len(self))[frame_key]
+        # Shape of the selection within one frame, without reading any data
+        frame_shape = np.broadcast_to(np.empty((), dtype=self.dtype), self.shape[1:])[rest].shape
+        out = np.empty((len(frames), *frame_shape), dtype=self.dtype)
+        buffer = np.empty(self.shape[1:], dtype=self.dtype)
+        for i, frame in enumerate(frames):
+            out[i] = read_cbf(self.fpaths[frame], out=buffer)[rest]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:]
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+    def __dask_tokenize__(self):
+        return (type(self).__name__, self.shape, tuple(self.fpaths))
+
+    def to_dask(self, chunks=1):
+        """
+        Dask array over the sweep, with ``chunks`` frames per chunk.
+        """
+        try:
+            import dask.array as da
+        except ImportError as exc:
+            raise ImportError("SweepArray.to_dask requires dask to be installed") from exc
+        return da.from_array(self, chunks=(chunks, *self.shape[1:]), asarray=False)
@@ -0,0 +1,155 @@
+import logging
+import threading
+import time as ttime
+
+import numpy as np
+from ophyd.device import do_not_wait_for_lazy_connection
+
+from .vector import MOTOR_DEBUG_SIGNALS
+
+logger = logging.getLogger(__name__)
+
+# Samples kept per signal
+DEFAULT_CAPACITY = 4096
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer of the latest (timestamp, value) samples of a signal.
+
+    The arrays are allocated once; appending a sample overwrites the oldest
+    one when the buffer is full. Values that are not numbers, such as enum
+    strings, are stored as the index of their label in ``labels``.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.labels = []
+        self._label_index = {}
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def dropped(self):
+        """
+        Number of samples overwritten since the buffer was created.
+        """
+        return self._next - self._count
+
+    def _encode(self, value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            value = str(value)
+            index = self._label_index.get(value)
+            if index is None:
+                index = self._label_index[value] = len(self.labels)
+                self.labels.append(value)
+            return index
+
+    def append(self, timestamp, value):
+        with self._lock:
+            i = self._next % self.capacity
+            self.timestamps[i] = timestamp
+            self.values[i] = self._encode(value)
+            self._next += 1
+            self._count = min(self._count + 1, self.capacity)
+
+    def samples(self, start=None, end=None):
+        """
+        Copies of the timestamps and values, oldest first, between the ``start`` and ``end`` times.
+        """
+        with self._lock:
+            order = np.arange(self._next - self._count, self._next) % self.capacity
+            timestamps = self.timestamps[order]
+            values = self.values[order]
+        keep = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            keep &= timestamps >= start
+        if end is not None:
+            keep &= timestamps <= end
+        return timestamps[keep], values[keep]
+
+
+class VectorTelemetry:
+    """
+    Opt-in recorder of the state, error and calculated motion of a VectorProgram.
+
+    Once started, every update of ``state``, ``active``, ``error`` and of the
+    debug signals of each motor (MOTOR_DEBUG_SIGNALS) is stored with its
+    timestamp in a RingBuffer of ``capacity`` samples. A callback only
+    writes two array elements, so the recorder can be left running.
+    A trace can be exported as a ``.npz`` file or replayed as events.
+    """
+
+    def __init__(self, vector, capacity=DEFAULT_CAPACITY):
+        self.vector = vector
+        signals = [vector.state, vector.active, vector.error]
+        for motor in (vector.o, vector.x, vector.y, vector.z):
+            # Debug signals not used yet connect in the background and report once connected
+            with do_not_wait_for_lazy_connection(motor):
+                signals += [getattr(motor, name) for name in MOTOR_DEBUG_SIGNALS]
+        self.buffers = {signal.name: RingBuffer(capacity) for signal in signals}
+        self._signals = signals
+        self._tokens = []
+
+    @property
+    def recording(self):
+        return bool(self._tokens)
+
+    def _on_update(self, value=None, timestamp=None, obj=None, **kwargs):
+        self.buffers[obj.name].append(ttime.time() if timestamp is None else timestamp, value)
+
+    def start(self):
+        if not self._tokens:
+            self._tokens = [(signal, signal.subscribe(self._on_update, run=False)) for signal in self._signals]
+
+    def stop(self):
+        for signal, token in self._tokens:
+            signal.unsubscribe(token)
+        self._tokens = []
+
+    def trace(self, start=None, end=None):
+        """
+        The samples between the ``start`` and ``end`` times as {name: (timestamps, values, labels)}.
+        """
+        trace = {}
+        for name, buffer in self.buffers.items():
+            timestamps, values = buffer.samples(start, end)
+            trace[name] = (timestamps, values, list(buffer.labels))
+        return trace
+
+    def export(self, path, start=None, end=None):
+        """
+        Write the trace to a compressed ``.npz`` file with ``<name>_timestamps``,
+        ``<name>_values`` and, for enum signals, ``<name>_labels`` arrays.
+        """
+        arrays = {}
+        for name, (timestamps, values, labels) in self.trace(start, end).items():
+            arrays[f"{name}_timestamps"] = timestamps
+            arrays[f"{name}_values"] = values
+            if labels:
+                arrays[f"{name}_labels"] = np.array(labels)
+        np.savez_compressed(path, **arrays)
+        logger.debug(f"VectorTelemetry: exported {len(arrays)} arrays to {path}")
+
+    def events(self, start=None, end=None):
+        """
+        Yield the samples of all the signals as (timestamp, name, value), in time order.
+        """
+        names, timestamps, values = [], [], []
+        for name, (ts, vs, labels) in self.trace(start, end).items():
+            names += [name] * len(ts)
+            timestamps.append(ts)
+            values += [labels[int(v)] for v in vs] if labels else vs.tolist()
+        if not names:
+            return
+        timestamps = np.concatenate(timestamps)
+        for i in np.argsort(timestamps, kind="stable"):
+            yield float(timestamps[i]), names[i], values[i]
@@ -0,0 +1,85 @@
+import os
+import types
+
+import numpy as np
+import pytest
+from fabio.cbfimage import CbfImage, PilatusHeader
+
+from nyxtools.vector import VectorProgram
+
+PILATUS_HEADER = """\
+# Detector: PILATUS 6M, S/N 60-0100
+# Pixel_size 172e-6 m x 172e-6 m
+# Silicon sensor, thickness 0.000450 m
+# Exposure_time 0.0976 s
+# Exposure_period 0.1 s
+# Tau = 0 s
+# Count_cutoff 1048575 counts
+# Threshold_setting: 6330 eV
+# Wavelength 0.9793 A
+# Detector_distance 0.3 m
+# Beam_xy (1231.50, 1263.50) pixels
+# Filter_transmission 1.0
+# Start_angle {start_angle} deg.
+# Angle_increment 0.1 deg.
+"""
+
+
+def make_frame(shape=(64, 48), seed=0):
+    """Synthetic Pilatus-like frame: Poisson background, gaps, bad pixels and hot spots."""
+    rng = np.random.default_rng(seed)
+    data = rng.poisson(2.0, shape).astype(np.int32)
+    data[:, shape[1] // 2] = -1
+    data[shape[0] // 3, :] = -1
+    data[rng.integers(0, shape[0], 5), rng.integers(0, shape[1], 5)] = -2
+    # Hot spots, some of them beyond 16 bits
+    data[rng.integers(0, shape[0], 20), rng.integers(0, shape[1], 20)] = rng.integers(200, 30000, 20)
+    data[rng.integers(0, shape[0], 5), rng.integers(0, shape[1], 5)] = rng.integers(40000, 1048575, 5)
+    return data
+
+
+def write_cbf(fpath, data, start_angle=0.0):
+    image = CbfImage(data=data)
+    image.pilatus_headers = PilatusHeader(PILATUS_HEADER.format(start_angle=start_angle))
+    image.write(str(fpath))
+    return fpath
+
+
+def fake_vector(*methods, **attrs):
+    """
+    Stand-in for a VectorProgram: ``attrs`` are its signals and settings, and
+    ``methods`` the names of the VectorProgram methods to bind to it.
+    """
+    vector = types.SimpleNamespace(**{"name": "vector", **attrs})
+    for name in methods:
+        setattr(vector, name, types.MethodType(getattr(VectorProgram, name), vector))
+    return vector
+
+
+def hide(paths):
+    """Rename files away, as if the detector had not written them yet."""
+    for fpath in paths:
+        os.rename(fpath, f"{fpath}.part")
+
+
+def reveal(fpath):
+    os.rename(f"{fpath}.part", fpath)
+
+
+@pytest.fixture
+def cbf_sweep(tmp_path):
+    """Write a small sweep of synthetic frames named like the NYXFlyer resources."""
+
+    def _make(num_images=5, shape=(64, 48), file_prefix="test", file_number_start=1, max_count=None):
+        frames = []
+        paths = []
+        for i in range(num_images):
+            img = file_number_start + i
+            data = make_frame(shape, seed=img)
+            if max_count is not None:
+                data = np.minimum(data, max_count)
+            paths.append(write_cbf(tmp_path / f"{file_prefix}_{img:05d}.cbf", data, start_angle=0.1 * i))
+            frames.append(data)
+        return paths, frames
+
+    return _make
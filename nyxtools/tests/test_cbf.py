@@ -0,0 +1,51 @@
+import fabio
+import numpy as np
+
+from nyxtools.cbf import compact_frame, read_cbf, read_cbf_header
+
+from .conftest import make_frame, write_cbf
+
+
+def test_read_cbf_into_out(tmp_path):
+    frame = make_frame()
+    fpath = write_cbf(tmp_path / "frame.cbf", frame)
+    out = np.empty(frame.shape, dtype=np.int32)
+    assert read_cbf(fpath, out=out) is out
+    np.testing.assert_array_equal(out, frame)
+
+
+def test_read_cbf_header(tmp_path):
+    fpath = write_cbf(tmp_path / "frame.cbf", make_frame(), start_angle=12.5)
+    header = read_cbf_header(fpath)
+    expected = fabio.open(str(fpath)).pilatus_headers
+    for key in ("Detector", "Exposure_time", "Count_cutoff", "Beam_xy", "Pixel_size", "Wavelength"):
+        assert header[key] == expected[key]
+    assert header["Start_angle"] == 12.5
+    assert header["Angle_increment"] == 0.1
+    assert isinstance(header["Count_cutoff"], int)
+
+
+def test_read_cbf_header_skips_binary_section(tmp_path):
+    fpath = write_cbf(tmp_path / "frame.cbf", make_frame((512, 512)))
+    blob = fpath.read_bytes()
+    # Everything after the text header is garbage, the header is still readable
+    fpath.write_bytes(blob[: blob.index(b"_array_data.data")] + b"_array_data.data\n" + b"\x00" * 100)
+    assert read_cbf_header(fpath)["Count_cutoff"] == 1048575
+
+
+def test_compact_frame():
+    frame = make_frame()
+    frame[frame > 1000] = 1000
+    int16 = compact_frame(frame, "int16")
+    assert int16.dtype == np.int16
+    np.testing.assert_array_equal(int16, frame)
+
+    uint16 = compact_frame(frame, np.uint16)
+    assert uint16.dtype == np.uint16
+    np.testing.assert_array_equal(uint16, np.where(frame < 0, 0, frame))
+
+    frame[0, 0] = 40000
+    assert compact_frame(frame, "int16") is None
+    assert compact_frame(frame, "uint16")[0, 0] == 40000
+    frame[0, 0] = 70000
+    assert compact_frame(frame, "uint16") is None
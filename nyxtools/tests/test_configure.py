@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+from ophyd import Signal
+from ophyd.status import Status
+from ophyd.utils import WaitTimeoutError
+
+from nyxtools.configure import ConfigCache, put_config, put_many
+
+
+class SlowSignal(Signal):
+    def __init__(self, *args, delay=0.2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+
+    def set(self, value, **kwargs):
+        status = Status(obj=self)
+
+        def finish():
+            self.put(value)
+            status.set_finished()
+
+        threading.Timer(self.delay, finish).start()
+        return status
+
+
+def test_put_many_overlaps_puts():
+    signals = [SlowSignal(name=f"sig{i}", value=0) for i in range(5)]
+    latencies = put_many([(signal, i + 1) for i, signal in enumerate(signals)])
+    assert [signal.get() for signal in signals] == [1, 2, 3, 4, 5]
+    assert set(latencies) == {signal.name for signal in signals}
+    # Sequential puts would take 5 * 0.2 s
+    assert max(latencies.values()) < 0.6
+
+
+def test_put_many_timeout():
+    with pytest.raises(WaitTimeoutError):
+        put_many([(Signal(name="fast", value=0), 1), (SlowSignal(name="slow", value=0, delay=1), 1)], timeout=0.1)
+
+
+def test_put_many_empty():
+    assert put_many([]) == {}
+
+
+def test_config_cache_skips_unchanged_puts():
+    cache = ConfigCache()
+    exposure = Signal(name="exposure", value=0)
+    hold = Signal(name="hold", value=0)
+    assert set(cache.put_many([(exposure, 10.0), (hold, False)])) == {"exposure", "hold"}
+    assert cache.put_many([(exposure, 10.0), (hold, False)]) == {}
+    assert set(put_config(cache, [(exposure, 10.0 + 1e-12), (hold, True)])) == {"hold"}
+    assert hold.get() is True
+    assert cache.stats() == {"writes": 3, "skipped": 3, "invalidations": 0, "entries": 2}
+
+
+def test_config_cache_monitor_invalidates():
+    cache = ConfigCache()
+    exposure = Signal(name="exposure", value=0)
+    cache.put_many([(exposure, 10.0)])
+    # Changed by another client
+    exposure.put(20.0)
+    assert exposure not in cache
+    cache.put_many([(exposure, 10.0)])
+    assert exposure.get() == 10.0
+    assert cache.stats()["invalidations"] == 1
+
+    cache.invalidate(exposure)
+    assert exposure not in cache
+    cache.clear()
+    assert not exposure._callbacks["value"]
@@ -0,0 +1,201 @@
+import os
+import threading
+import time as ttime
+from types import SimpleNamespace
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+import pytest
+from bluesky import RunEngine
+from event_model import Filler
+from ophyd import Signal
+
+from nyxtools.flyer import NYXFlyer, collect_while_acquiring, datum_events
+from nyxtools.flyer_eiger2 import NYXEiger2Flyer
+from nyxtools.handlers import PilatusHandlerMX
+
+from .conftest import hide, reveal
+
+
+@pytest.fixture
+def flyer(tmp_path):
+    """
+    A flyer without hardware, set up for the three frames cbf_sweep writes by default.
+    """
+    cam = SimpleNamespace(
+        num_images=Signal(name="num_images", value=3),
+        array_size=SimpleNamespace(
+            array_size_y=Signal(name="array_size_y", value=64), array_size_x=Signal(name="array_size_x", value=48)
+        ),
+        array_counter=Signal(name="array_counter", value=0),
+    )
+    flyer = NYXFlyer(vector=None, zebra=None, detector=SimpleNamespace(name="pilatus", cam=cam))
+    flyer.unstage = lambda: None
+    flyer.data_directory_name = str(tmp_path)
+    flyer.file_prefix = "test"
+    flyer.num_images = 3
+    flyer.file_number_start = 1
+    return flyer
+
+
+def test_extract_metadata_reads_header_only(cbf_sweep, flyer):
+    paths, _ = cbf_sweep(num_images=2)
+    flyer._first_file = str(paths[1])
+    assert flyer._extract_metadata() == pytest.approx(0.1)
+    assert flyer._extract_metadata("Angle_increment") == pytest.approx(0.1)
+
+
+def test_collect_asset_docs_records_first_file(cbf_sweep, flyer):
+    paths, _ = cbf_sweep(num_images=3, file_number_start=7)
+    flyer.file_number_start = 7
+    docs = list(flyer.collect_asset_docs())
+    assert [name for name, _ in docs] == ["resource", "datum"] * 3
+    assert flyer._first_file == str(paths[0])
+    assert flyer._extract_metadata() == 0.0
+
+
+def test_sweep_array(cbf_sweep, flyer):
+    _, frames = cbf_sweep(num_images=3, file_number_start=7)
+    flyer.file_number_start = 7
+    sweep = flyer.sweep_array()
+    assert sweep.shape == (3, 64, 48)
+    np.testing.assert_array_equal(sweep[2], frames[2])
+
+
+def test_collect_asset_docs_single_resource(cbf_sweep, flyer):
+    _, frames = cbf_sweep(num_images=3, file_number_start=7)
+    flyer.file_number_start = 7
+    flyer.single_resource = True
+    (_, resource), (_, datum_page) = flyer.collect_asset_docs()
+    assert datum_page["datum_kwargs"] == {"frame_num": [7, 8, 9]}
+    assert flyer._datum_ids == datum_page["datum_id"]
+    assert flyer._extract_metadata() == 0.0
+
+    handler = PilatusHandlerMX(
+        os.path.join(resource["root"], resource["resource_path"]), **resource["resource_kwargs"]
+    )
+    np.testing.assert_array_equal(handler(frame_num=9), frames[2])
+    assert handler("omega", frame_num=8) == pytest.approx(0.1)
+
+
+def test_datum_events_chunks():
+    events = list(datum_events({"a": list(range(5)), "b": list("vwxyz")}, chunk_size=2))
+    assert [event["data"] for event in events[3:]] == [{"a": 3, "b": "y"}, {"a": 4, "b": "z"}]
+    assert all(event["filled"] == {"a": False, "b": False} for event in events)
+    # Built once per chunk
+    assert events[0]["timestamps"] is events[1]["timestamps"] is not events[2]["timestamps"]
+    assert events[2]["time"] == events[3]["timestamps"]["b"]
+    assert list(datum_events({"a": []})) == []
+
+
+def test_collect_run_engine_filling(cbf_sweep, flyer):
+    _, frames = cbf_sweep(num_images=3)
+    docs = []
+    RunEngine({})(bpp.run_wrapper(bps.collect(flyer)), lambda name, doc: docs.append((name, doc)))
+    filler = Filler({"AD_PILATUS_MX": PilatusHandlerMX}, inplace=False)
+    (page,) = [doc for name, doc in (filler(name, doc) for name, doc in docs) if name == "event_page"]
+    # The Filler swaps False for the datum id of every frame it loaded
+    assert all(page["filled"]["pilatus_image"])
+    np.testing.assert_array_equal(np.stack(page["data"]["pilatus_image"]), np.stack(frames))
+
+
+def test_eiger2_collect(monkeypatch):
+    flyer = NYXEiger2Flyer(vector=None, zebra=None, detector=SimpleNamespace(name="eiger"))
+    monkeypatch.setattr(flyer, "unstage", lambda: None)
+    monkeypatch.setattr(flyer, "_extract_metadata", lambda: 12.5)
+    flyer._datum_ids = {"data": "uid/data", "omega": "uid/omega"}
+    (event,) = flyer.collect()
+    assert event["data"] == {"eiger_image": "uid/data", "omega": "uid/omega"}
+    assert event["filled"] == {"eiger_image": False, "omega": False}
+    assert flyer._master_metadata == 12.5
+
+
+@pytest.mark.parametrize("single_resource", [False, True])
+def test_streaming_collect(cbf_sweep, flyer, single_resource):
+    paths, _ = cbf_sweep(num_images=3)
+    hide(paths)
+    unstaged = []
+    flyer.unstage = lambda: unstaged.append(True)
+    flyer.single_resource = single_resource
+    flyer.streaming = True
+    flyer._start_watcher()
+
+    assert list(flyer.collect()) == []
+    reveal(paths[0])
+    reveal(paths[1])
+    docs = list(flyer.collect_asset_docs())
+    events = [event["data"]["pilatus_image"] for event in flyer.collect()]
+    assert events == flyer._datum_ids and len(events) == 2
+    assert not unstaged
+
+    reveal(paths[2])
+    docs += list(flyer.collect_asset_docs())
+    events += [event["data"]["pilatus_image"] for event in flyer.collect()]
+    assert events == flyer._datum_ids and len(events) == 3
+    assert unstaged == [True]
+    if single_resource:
+        assert [name for name, _ in docs] == ["resource", "datum_page", "datum_page"]
+    else:
+        assert [name for name, _ in docs] == ["resource", "datum"] * 3
+
+
+def test_collect_while_acquiring(cbf_sweep, flyer):
+    paths, _ = cbf_sweep(num_images=3)
+    hide(paths)
+    flyer.streaming = True
+    flyer._start_watcher()
+
+    def acquire():
+        for i, path in enumerate(paths):
+            ttime.sleep(0.2)
+            reveal(path)
+            flyer.detector.cam.array_counter.put(i + 1)
+
+    threading.Thread(target=acquire).start()
+    docs = []
+    RunEngine({})(
+        bpp.run_wrapper(collect_while_acquiring(flyer, timeout=0.05)), lambda name, doc: docs.append((name, doc))
+    )
+    pages = [doc for name, doc in docs if name == "event_page"]
+    # Documents came out while the frames were being written, not all at the end
+    assert len(pages) > 1
+    assert sum((page["data"]["pilatus_image"] for page in pages), []) == flyer._datum_ids
+    assert len(flyer._datum_ids) == 3
+
+
+def test_collect_while_acquiring_stall(cbf_sweep, flyer):
+    paths, _ = cbf_sweep(num_images=3)
+    hide(paths)
+    flyer.streaming = True
+    flyer._start_watcher()
+    with pytest.raises(TimeoutError, match="no new frame"):
+        RunEngine({})(bpp.run_wrapper(collect_while_acquiring(flyer, timeout=0.05, stall_timeout=0.2)))
+
+
+def test_wait_for_frames_needs_streaming(flyer):
+    with pytest.raises(RuntimeError, match="streaming"):
+        flyer.wait_for_frames(0.1)
+
+
+def test_collect_asset_docs_verify(cbf_sweep, tmp_path, flyer):
+    cbf_sweep(num_images=3)
+    flyer.verify = True
+    resources = [doc for name, doc in flyer.collect_asset_docs() if name == "resource"]
+    assert {doc["resource_kwargs"]["manifest"] for doc in resources} == {str(tmp_path / "test_manifest.json")}
+    mtime_ns = os.stat(tmp_path / "test_manifest.json").st_mtime_ns
+    assert {doc["resource_kwargs"]["manifest_mtime_ns"] for doc in resources} == {mtime_ns}
+
+    flyer.num_images = 4
+    resources = [doc for name, doc in flyer.collect_asset_docs() if name == "resource"]
+    assert all(doc["resource_kwargs"] == {} for doc in resources)
+
+
+def test_collect_asset_docs_verify_unwritable(cbf_sweep, tmp_path, flyer, caplog):
+    cbf_sweep(num_images=3)
+    # The manifest cannot be written
+    os.mkdir(tmp_path / "test_manifest.json")
+    flyer.verify = True
+    resources = [doc for name, doc in flyer.collect_asset_docs() if name == "resource"]
+    assert len(resources) == 3 and all(doc["resource_kwargs"] == {} for doc in resources)
+    assert "continuing without a manifest" in caplog.text
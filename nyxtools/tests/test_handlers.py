@@ -0,0 +1,233 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from nyxtools.cache import FrameCache
+from nyxtools.handlers import PilatusHandlerMX, read_frames, read_sweep
+from nyxtools.prefetch import Prefetcher
+from nyxtools.sweep import verify_sweep
+
+
+def test_handler_reads_frame(cbf_sweep):
+    paths, frames = cbf_sweep(num_images=1)
+    np.testing.assert_array_equal(PilatusHandlerMX(paths[0])(), frames[0])
+
+
+def test_handler_missing_file(tmp_path):
+    with pytest.raises(RuntimeError):
+        PilatusHandlerMX(tmp_path / "missing.cbf")
+
+
+def test_handler_template_frame_num(cbf_sweep, tmp_path):
+    paths, frames = cbf_sweep(num_images=3, file_number_start=4)
+    handler = PilatusHandlerMX(
+        tmp_path / "test", template="{file_prefix}_{img:05d}.cbf", frame_start=4, num_images=3
+    )
+    np.testing.assert_array_equal(handler(frame_num=5), frames[1])
+    assert handler.get_file_list([{"frame_num": 4}, {"frame_num": 6}]) == [str(paths[0]), str(paths[2])]
+    with pytest.raises(RuntimeError):
+        handler(frame_num=7)
+    with pytest.raises(RuntimeError):
+        handler()
+
+
+def test_handler_manifest_skips_stat(cbf_sweep, tmp_path, monkeypatch):
+    paths, frames = cbf_sweep(num_images=2)
+    report = verify_sweep(tmp_path, "test", 1, 2, write_manifest=True)
+    manifest = report["manifest"]
+
+    def is_file(self):
+        raise AssertionError("stat of a file listed in the manifest")
+
+    monkeypatch.setattr(pathlib.Path, "is_file", is_file)
+    np.testing.assert_array_equal(PilatusHandlerMX(paths[1], manifest=manifest)(), frames[1])
+
+    # With the mtime from the resource, not even the manifest is stat'ed
+    stat = os.stat
+    stats = []
+    monkeypatch.setattr(os, "stat", lambda *args, **kwargs: stats.append(args) or stat(*args, **kwargs))
+    PilatusHandlerMX(paths[0], manifest=manifest, manifest_mtime_ns=report["manifest_mtime_ns"])
+    monkeypatch.setattr(os, "stat", stat)
+    assert stats == []
+    with pytest.raises(AssertionError):
+        PilatusHandlerMX(paths[1], manifest=tmp_path / "missing.json")
+
+
+@pytest.fixture
+def frame_cache():
+    PilatusHandlerMX.frame_cache = FrameCache(max_bytes=3 * 64 * 48 * 4)
+    yield PilatusHandlerMX.frame_cache
+    PilatusHandlerMX.frame_cache = None
+
+
+def test_handler_frame_cache(cbf_sweep, frame_cache):
+    paths, frames = cbf_sweep(num_images=4)
+    first = PilatusHandlerMX(paths[0])()
+    assert PilatusHandlerMX(paths[0])() is first
+    assert not first.flags.writeable
+    with pytest.raises(ValueError):
+        first[0, 0] = 1
+
+    for fpath in paths[1:]:
+        PilatusHandlerMX(fpath)()
+    stats = frame_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 4, 1)
+    assert stats["entries"] == 3
+    assert stats["nbytes"] <= stats["max_bytes"]
+    np.testing.assert_array_equal(PilatusHandlerMX(paths[0])(), frames[0])
+
+
+def test_frame_cache_sees_rewritten_file(cbf_sweep, frame_cache):
+    paths, frames = cbf_sweep(num_images=2)
+    PilatusHandlerMX(paths[0])()
+    paths[0].write_bytes(paths[1].read_bytes())
+    os.utime(paths[0], ns=(0, 0))
+    np.testing.assert_array_equal(PilatusHandlerMX(paths[0])(), frames[1])
+
+
+def test_handler_data_keys(cbf_sweep):
+    paths, frames = cbf_sweep(num_images=3)
+    handler = PilatusHandlerMX(paths[2])
+    assert handler("omega") == pytest.approx(0.2)
+    assert handler("Start_angle") == pytest.approx(0.2)
+    assert handler("Count_cutoff") == 1048575
+    assert handler("Beam_xy") == (1231.5, 1263.5)
+    assert handler("header")["Exposure_time"] == 0.0976
+    np.testing.assert_array_equal(handler("bit_mask"), frames[2] < 0)
+    with pytest.raises(RuntimeError):
+        handler("no_such_key")
+
+
+@pytest.mark.parametrize("max_workers, use_processes", [(1, False), (3, False), (2, True)])
+def test_read_frames(cbf_sweep, max_workers, use_processes):
+    paths, frames = cbf_sweep(num_images=5)
+    data = read_frames(paths, max_workers=max_workers, use_processes=use_processes)
+    assert data.shape == (5, 64, 48) and data.dtype == np.int32
+    np.testing.assert_array_equal(data, np.stack(frames))
+
+
+def test_read_sweep_into_out(cbf_sweep, tmp_path, frame_cache):
+    paths, frames = cbf_sweep(num_images=5, file_number_start=11)
+    PilatusHandlerMX(paths[1])()
+    out = np.zeros((3, 64, 48), dtype=np.int32)
+    assert read_sweep(str(tmp_path), "test", 12, 3, out=out, use_processes=True) is out
+    np.testing.assert_array_equal(out, np.stack(frames[1:4]))
+    assert frame_cache.hits == 1
+    with pytest.raises(ValueError):
+        read_frames(paths, out=out)
+
+
+@pytest.fixture
+def prefetcher(frame_cache):
+    frame_cache.max_bytes = 1 << 30
+    PilatusHandlerMX.prefetcher = Prefetcher(frame_cache, min_depth=2, max_depth=4)
+    yield PilatusHandlerMX.prefetcher
+    PilatusHandlerMX.prefetcher.close()
+    PilatusHandlerMX.prefetcher = None
+
+
+def test_prefetcher_reads_ahead(cbf_sweep, frame_cache, prefetcher):
+    paths, frames = cbf_sweep(num_images=10)
+    for i in range(3):
+        np.testing.assert_array_equal(PilatusHandlerMX(paths[i])(), frames[i])
+    prefetcher.join()
+    assert FrameCache.key(paths[3]) in frame_cache
+    assert FrameCache.key(paths[4]) in frame_cache
+
+    hits = frame_cache.hits
+    np.testing.assert_array_equal(PilatusHandlerMX(paths[3])(), frames[3])
+    assert frame_cache.hits == hits + 1
+    assert prefetcher.depth == prefetcher.max_depth
+
+    # Running past the end of the sweep is harmless
+    for i in range(4, 10):
+        PilatusHandlerMX(paths[i])()
+    prefetcher.join()
+    assert prefetcher.stats()["pending"] == 0
+
+
+def test_prefetcher_resets_on_random_access(cbf_sweep, frame_cache, prefetcher):
+    paths, _ = cbf_sweep(num_images=10)
+    PilatusHandlerMX(paths[0])()
+    PilatusHandlerMX(paths[1])()
+    PilatusHandlerMX(paths[7])()
+    assert prefetcher.depth == prefetcher.min_depth
+    prefetcher.join()
+    PilatusHandlerMX(paths[2])()
+    prefetcher.join()
+    # A lone random request schedules nothing
+    assert FrameCache.key(paths[8]) not in frame_cache
+    assert FrameCache.key(paths[4]) not in frame_cache
+
+
+def test_prefetcher_ignores_repeated_frame(cbf_sweep, frame_cache, prefetcher):
+    paths, frames = cbf_sweep(num_images=10)
+    handler = PilatusHandlerMX(paths[1])
+    PilatusHandlerMX(paths[0])()
+    handler()
+    depth = prefetcher.depth
+    issued = prefetcher.issued
+    # The mask of the same frame is neither sequential nor random access
+    np.testing.assert_array_equal(handler("bit_mask"), frames[1] < 0)
+    handler()
+    assert prefetcher.depth == depth > prefetcher.min_depth
+    assert prefetcher.issued == issued
+    assert prefetcher.cancelled == 0
+    PilatusHandlerMX(paths[2])()
+    prefetcher.join()
+    assert FrameCache.key(paths[3]) in frame_cache
+
+
+def test_handler_compact_dtype(cbf_sweep):
+    paths, frames = cbf_sweep(num_images=2, max_count=60000)
+    data = PilatusHandlerMX(paths[0], dtype="uint16")()
+    assert data.dtype == np.uint16
+    np.testing.assert_array_equal(data, np.maximum(frames[0], 0))
+    np.testing.assert_array_equal(PilatusHandlerMX(paths[0], dtype="uint16")("bit_mask"), frames[0] < 0)
+    # Does not fit in int16: int32 is returned
+    assert PilatusHandlerMX(paths[0], dtype="int16")().dtype == np.int32
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_read_frames_compact(cbf_sweep, use_processes):
+    paths, frames = cbf_sweep(num_images=4, max_count=60000)
+    data = read_frames(paths, dtype=np.uint16, max_workers=2, use_processes=use_processes)
+    assert data.dtype == np.uint16
+    np.testing.assert_array_equal(data, np.maximum(np.stack(frames), 0))
+
+    promoted = read_frames(paths, dtype=np.int16, max_workers=2, use_processes=use_processes)
+    assert promoted.dtype == np.int32
+    np.testing.assert_array_equal(promoted, np.stack(frames))
+
+    with pytest.raises(ValueError):
+        read_frames(paths, out=np.empty((4, 64, 48), dtype=np.int16))
+
+
+def test_handler_masked(cbf_sweep):
+    paths, frames = cbf_sweep(num_images=1, max_count=60000)
+    view = PilatusHandlerMX(paths[0], masked=True)()
+    assert isinstance(view, np.ma.MaskedArray)
+    np.testing.assert_array_equal(view.mask, frames[0] < 0)
+    data, mask = PilatusHandlerMX(paths[0], dtype="uint16").data_and_mask()
+    assert data.dtype == np.uint16
+    np.testing.assert_array_equal(mask, frames[0] < 0)
+
+
+def test_read_frames_mask(cbf_sweep):
+    paths, frames = cbf_sweep(num_images=3, max_count=60000)
+    mask = np.empty((3, 64, 48), dtype=bool)
+    read_frames(paths, dtype="uint16", mask=mask, max_workers=1)
+    np.testing.assert_array_equal(mask, np.stack(frames) < 0)
+
+
+def test_handlers_import_without_shared_memory():
+    # multiprocessing.shared_memory needs Python 3.8, only process reads use it
+    code = "import sys, nyxtools.handlers; print('multiprocessing.shared_memory' in sys.modules)"
+    assert (
+        subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        == "False\n"
+    )
@@ -0,0 +1,28 @@
+import numpy as np
+
+from nyxtools.mask import frame_mask, gap_mask, masked_frame
+
+from .conftest import make_frame
+
+
+def test_gap_mask_pilatus_6m():
+    mask = gap_mask((2527, 2463))
+    assert mask is gap_mask((2527, 2463))
+    assert not mask.flags.writeable
+    # 12 x 5 modules of 195 x 487 pixels
+    assert (~mask).sum() == 60 * 195 * 487
+    assert mask[195:212].all() and mask[:, 487:494].all()
+    assert not mask[:195, :487].any()
+
+
+def test_gap_mask_unknown_geometry():
+    assert not gap_mask((64, 48)).any()
+
+
+def test_frame_mask_and_masked_frame():
+    frame = make_frame()
+    mask = frame_mask(frame)
+    np.testing.assert_array_equal(mask, frame < 0)
+    view = masked_frame(frame, mask)
+    assert view.data is frame or np.shares_memory(view.data, frame)
+    assert view.count() == (frame >= 0).sum()
@@ -0,0 +1,72 @@
+import threading
+import time as ttime
+from types import SimpleNamespace
+
+import pytest
+from ophyd import Signal
+
+from nyxtools.configure import ConfigCache
+from nyxtools.flyer import NYXFlyer
+from nyxtools.ready import ready_stats, reset_ready_stats, wait_ready, zebra_armed
+
+
+@pytest.fixture
+def zebra():
+    reset_ready_stats()
+    yield SimpleNamespace(
+        reset=Signal(name="reset", value=0),
+        out1=Signal(name="out1", value=0),
+        m1_set_pos=Signal(name="m1_set_pos", value=0),
+        m2_set_pos=Signal(name="m2_set_pos", value=0),
+        m3_set_pos=Signal(name="m3_set_pos", value=0),
+        pc=SimpleNamespace(
+            arm_signal=Signal(name="arm_signal", value=0),
+            arm=SimpleNamespace(
+                output=Signal(name="output", value=0), trig_source=Signal(name="trig_source", value=1)
+            ),
+        ),
+    )
+
+
+def test_wait_ready_returns_on_readiness(zebra):
+    threading.Timer(0.1, zebra.pc.arm.output.put, [1]).start()
+    elapsed = wait_ready("zebra_armed", zebra_armed(zebra), 5)
+    assert 0.05 < elapsed < 1
+    stats = ready_stats()["zebra_armed"]
+    assert (stats["count"], stats["timeouts"]) == (1, 0)
+    assert stats["mean"] == stats["last"] == elapsed
+
+
+def test_wait_ready_timeout_and_fallback(zebra):
+    status = zebra_armed(zebra)
+    assert wait_ready("zebra_armed", status, 0.05) >= 0.05
+    assert status.done and not status.success
+    assert not zebra.pc.arm.output._callbacks["value"]
+    assert wait_ready("zebra_armed", None, 0.05) >= 0.05
+    stats = ready_stats()["zebra_armed"]
+    assert (stats["count"], stats["timeouts"]) == (2, 1)
+
+
+def test_flyer_waits_for_zebra(zebra):
+    flyer = NYXFlyer(
+        vector=SimpleNamespace(move=lambda: "moving"), zebra=zebra, detector=SimpleNamespace(stage=lambda: None)
+    )
+    flyer.fallback_delays = {"zebra_reset": 0.1, "zebra_armed": 5}
+    start = ttime.monotonic()
+    flyer.zebra_daq_prep()
+    zebra.pc.arm.output.put(1)
+    assert flyer.kickoff() == "moving"
+    assert 0.1 <= ttime.monotonic() - start < 1
+    assert zebra.pc.arm.trig_source.get() == 0
+    assert set(ready_stats()) == {"zebra_reset", "zebra_armed"}
+
+
+def test_zebra_reset_invalidates_cached_setpoints(zebra):
+    flyer = NYXFlyer(vector=None, zebra=zebra)
+    flyer.config_cache = ConfigCache()
+    flyer.fallback_delays = {"zebra_reset": 0, "zebra_armed": 0}
+    flyer.zebra_daq_prep()
+    # The reset puts the registers back to their defaults before the monitors report it
+    flyer.zebra_daq_prep()
+    assert flyer.config_cache.stats()["writes"] == 4
+    assert flyer.config_cache.stats()["skipped"] == 0
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+
+from nyxtools.cbf import read_cbf
+from nyxtools.sweep import SweepArray, manifest_files, read_sweep_headers, verify_sweep
+
+
+def test_read_sweep_headers(cbf_sweep, tmp_path):
+    paths, _ = cbf_sweep(num_images=6, file_number_start=3)
+    paths[2].unlink()
+    table = read_sweep_headers(str(tmp_path), "test", 3, 7)
+    assert table.shape == (7,)
+    np.testing.assert_array_equal(table["frame"], np.arange(3, 10))
+    present = [0, 1, 3, 4, 5]
+    np.testing.assert_allclose(table["start_angle"][present], 0.1 * np.array(present))
+    np.testing.assert_allclose(table["angle_incr"][present], 0.1)
+    assert table["beam_x"][0] == 1231.5 and table["beam_y"][0] == 1263.5
+    assert table["wavelength"][0] == pytest.approx(0.9793)
+    assert table["size"][0] == paths[0].stat().st_size
+    assert table["mtime"][0] == paths[0].stat().st_mtime
+    # Frame 5 was deleted and frame 9 never written
+    assert list(table["size"][[2, 6]]) == [-1, -1]
+    assert np.isnan(table["start_angle"][[2, 6]]).all()
+    # Blocks of several consecutive frames per worker
+    blocked = read_sweep_headers(str(tmp_path), "test", 3, 7, max_workers=3)
+    for name in table.dtype.names:
+        np.testing.assert_array_equal(blocked[name], table[name])
+
+
+def test_sweep_array_slicing(cbf_sweep, tmp_path, monkeypatch):
+    paths, frames = cbf_sweep(num_images=6, file_number_start=1)
+    expected = np.stack(frames)
+    sweep = SweepArray.from_sweep(str(tmp_path), "test", 1, 6)
+    assert sweep.shape == (6, 64, 48) and len(sweep) == 6
+
+    decoded = []
+    monkeypatch.setattr(
+        "nyxtools.sweep.read_cbf", lambda fpath, out=None: decoded.append(fpath) or read_cbf(fpath)
+    )
+    np.testing.assert_array_equal(sweep[2:4, 10:20, :], expected[2:4, 10:20, :])
+    assert decoded == [str(paths[2]), str(paths[3])]
+
+    np.testing.assert_array_equal(sweep[-1], expected[-1])
+    np.testing.assert_array_equal(sweep[1, 5], expected[1, 5])
+    np.testing.assert_array_equal(sweep[[0, 5], ..., ::7], expected[[0, 5], ..., ::7])
+    np.testing.assert_array_equal(sweep[..., 3], expected[..., 3])
+    np.testing.assert_array_equal(np.asarray(sweep), expected)
+
+
+def test_sweep_array_to_dask(cbf_sweep, tmp_path):
+    da = pytest.importorskip("dask.array")
+    _, frames = cbf_sweep(num_images=4)
+    lazy = SweepArray.from_sweep(str(tmp_path), "test", 1, 4).to_dask()
+    assert isinstance(lazy, da.Array)
+    assert lazy.chunks[0] == (1, 1, 1, 1)
+    np.testing.assert_array_equal(lazy[1:3, :, 5].compute(), np.stack(frames)[1:3, :, 5])
+
+
+def test_verify_sweep(cbf_sweep, tmp_path):
+    paths, _ = cbf_sweep(num_images=5, file_number_start=3)
+    cbf_sweep(num_images=2, file_prefix="other")
+    report = verify_sweep(tmp_path, "test", 3, 5, write_manifest=True)
+    assert (report["missing"], report["truncated"]) == ([], [])
+    assert sorted(report["sizes"]) == [3, 4, 5, 6, 7]
+    assert manifest_files(report["manifest"]) == {os.path.basename(fpath) for fpath in paths}
+    assert manifest_files(report["manifest"], report["manifest_mtime_ns"]) == manifest_files(report["manifest"])
+
+    # The sweep is collected again with fewer frames under the same prefix
+    report = verify_sweep(tmp_path, "test", 3, 2, write_manifest=True)
+    os.utime(report["manifest"], ns=(0, 1))
+    assert manifest_files(report["manifest"]) == {os.path.basename(fpath) for fpath in paths[:2]}
+
+    os.remove(paths[1])
+    with open(paths[3], "r+b") as f:
+        f.truncate(100)
+    report = verify_sweep(tmp_path, "test", 3, 6, write_manifest=True)
+    assert (report["missing"], report["truncated"], report["manifest"]) == ([4, 8], [6], None)
+    assert verify_sweep(tmp_path, "test", 3, 5, min_size=50)["truncated"] == []
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import numpy as np
+from ophyd import Signal
+
+from nyxtools.telemetry import RingBuffer, VectorTelemetry
+from nyxtools.vector import MOTOR_DEBUG_SIGNALS
+
+from .conftest import fake_vector
+
+
+def test_ring_buffer_wraps_in_place():
+    buffer = RingBuffer(capacity=4)
+    timestamps, values = buffer.timestamps, buffer.values
+    for i in range(6):
+        buffer.append(float(i), i * 10)
+    assert buffer.timestamps is timestamps and buffer.values is values
+    assert len(buffer) == 4 and buffer.dropped == 2
+    ts, vs = buffer.samples()
+    assert ts.tolist() == [2, 3, 4, 5]
+    assert vs.tolist() == [20, 30, 40, 50]
+    ts, vs = buffer.samples(start=3, end=4)
+    assert vs.tolist() == [30, 40]
+
+
+def test_ring_buffer_labels():
+    buffer = RingBuffer(capacity=8)
+    for i, state in enumerate(["Idle", "Backup", "Acquiring", "Idle"]):
+        buffer.append(i, state)
+    assert buffer.labels == ["Idle", "Backup", "Acquiring"]
+    assert buffer.samples()[1].tolist() == [0, 1, 2, 0]
+
+
+def telemetry_vector():
+    def motor(name):
+        return SimpleNamespace(
+            lazy_wait_for_connection=True,
+            **{signal: Signal(name=f"vector_{name}_{signal}", value=0) for signal in MOTOR_DEBUG_SIGNALS},
+        )
+
+    return fake_vector(
+        state=Signal(name="vector_state", value="Idle"),
+        active=Signal(name="vector_active", value=0),
+        error=Signal(name="vector_error", value=0),
+        **{name: motor(name) for name in ("o", "x", "y", "z")},
+    )
+
+
+def test_vector_telemetry(tmp_path):
+    vector = telemetry_vector()
+    telemetry = VectorTelemetry(vector, capacity=16)
+    assert len(telemetry.buffers) == 3 + 4 * len(MOTOR_DEBUG_SIGNALS)
+    telemetry.start()
+    vector.o.des_speed.put(12.5, timestamp=1.0)
+    vector.state.put("Backup", timestamp=2.0)
+    vector.active.put(1, timestamp=2.5)
+    vector.state.put("Acquiring", timestamp=3.0)
+    vector.state.put("Idle", timestamp=4.0)
+    telemetry.stop()
+    vector.state.put("Backup", timestamp=5.0)
+    assert not telemetry.recording
+
+    assert list(telemetry.events(start=2.0)) == [
+        (2.0, "vector_state", "Backup"),
+        (2.5, "vector_active", 1.0),
+        (3.0, "vector_state", "Acquiring"),
+        (4.0, "vector_state", "Idle"),
+    ]
+
+    path = tmp_path / "trace.npz"
+    telemetry.export(path)
+    with np.load(path) as trace:
+        assert trace["vector_state_timestamps"].tolist() == [2.0, 3.0, 4.0]
+        assert trace["vector_state_labels"][trace["vector_state_values"].astype(int)].tolist() == [
+            "Backup",
+            "Acquiring",
+            "Idle",
+        ]
+        assert trace["vector_o_des_speed_values"].tolist() == [12.5]
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from ophyd import Signal
+from ophyd.utils import StatusTimeoutError
+
+from nyxtools.timeouts import MoveTimingStore, TimeoutPredictor
+from nyxtools.vector import VectorProgram
+
+from .conftest import fake_vector
+
+
+def test_store_round_trip(tmp_path):
+    store = MoveTimingStore(tmp_path / "moves.jsonl")
+    assert len(store.load()) == 0
+    store.append({"estimated_total_time_ms": 1000, "idle_s": 1.2})
+    with open(store.path, "a") as f:
+        f.write("{truncated\n")
+    store.append({"estimated_total_time_ms": 2000, "backup_s": 0.1, "idle_s": 2.5})
+    timings = store.load()
+    assert timings["idle_s"].tolist() == [1.2, 2.5]
+    assert np.isnan(timings["backup_s"][0])
+
+
+def test_predictor_fallback_and_fit(tmp_path):
+    predictor = TimeoutPredictor(MoveTimingStore(tmp_path / "moves.jsonl"), min_samples=5, sigmas=3, margin_s=1)
+    assert predictor.timeout(10000) == 50.0
+
+    rng = np.random.default_rng(0)
+    for ratio in rng.normal(1.1, 0.01, 20):
+        predictor.record({"estimated_total_time_ms": 10000}, idle_s=10 * ratio)
+    ratios = predictor.ratios(10000)
+    assert len(ratios) == 20
+    expected = (ratios.mean() + 3 * ratios.std(ddof=1)) * 10 + 1
+    assert predictor.timeout(12000) == pytest.approx(expected * 1.2 - 0.2)
+    assert predictor.timeout(10000) == pytest.approx(expected)
+    # Another regime still uses the heuristic
+    assert predictor.timeout(40000) == 200.0
+    # History is read back from the store
+    assert TimeoutPredictor(predictor.store, min_samples=5, sigmas=3, margin_s=1).timeout(10000) == pytest.approx(
+        expected
+    )
+
+
+def test_vector_records_moves(tmp_path):
+    predictor = TimeoutPredictor(MoveTimingStore(tmp_path / "moves.jsonl"))
+    state = Signal(name="state", value="Idle")
+    vector = fake_vector(
+        "_mark_transition",
+        "_record_move",
+        ready=True,
+        state=state,
+        active=state,
+        go=Signal(name="go", value=0),
+        calc_only=Signal(name="calc_only", value=1),
+        timeout_predictor=predictor,
+        timeout=10.0,
+        _estimate={"estimated_total_time_ms": 3000, "data_acq_duration": 2800, "max_time_to_speed": 50},
+    )
+
+    started = VectorProgram.move(vector)
+    finished = VectorProgram.track_move(vector)
+    for value in ("Backup", "Acquiring", "Idle"):
+        state.put(value)
+    finished.wait(1)
+    assert started.done and finished.done
+    (timing,) = predictor.store.load()
+    assert 0 <= timing["backup_s"] <= timing["acquiring_s"] <= timing["idle_s"]
+    assert timing["data_acq_duration"] == 2800
+
+
+def test_vector_move_survives_store_errors(tmp_path, caplog):
+    # The store cannot be written: its path is a directory
+    predictor = TimeoutPredictor(MoveTimingStore(tmp_path))
+    state = Signal(name="state", value="Idle")
+    vector = fake_vector(
+        "_mark_transition",
+        "_record_move",
+        ready=True,
+        state=state,
+        active=state,
+        go=Signal(name="go", value=0),
+        calc_only=Signal(name="calc_only", value=1),
+        timeout_predictor=predictor,
+        timeout=10.0,
+        _estimate={"estimated_total_time_ms": 3000},
+    )
+    VectorProgram.move(vector)
+    finished = VectorProgram.track_move(vector)
+    for value in ("Backup", "Acquiring", "Idle"):
+        state.put(value)
+    finished.wait(1)
+    assert finished.success
+    assert "Could not record the timing" in caplog.text
+
+
+def test_track_move_uses_timeout():
+    state = Signal(name="state", value="Idle")
+    vector = fake_vector(state=state, timeout=0.1)
+    finished = VectorProgram.track_move(vector)
+    state.put("Acquiring")
+    with pytest.raises(StatusTimeoutError):
+        finished.wait(2)
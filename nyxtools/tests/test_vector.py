@@ -0,0 +1,339 @@
+import threading
+import time as ttime
+import types
+from types import SimpleNamespace
+
+import pytest
+from ophyd import Signal
+from ophyd.sim import make_fake_device
+
+from nyxtools.vector import MOTOR_DEBUG_SIGNALS, CalcWatcher, StateWatcher, VectorMotor, VectorProgram
+from nyxtools.vector_profile import ProfileCache, VectorProfileModel
+
+from .conftest import fake_vector
+
+
+def calc_signals():
+    return [Signal(name=name, value=0) for name in ("duration", "time_to_speed", "error")]
+
+
+def test_calc_watcher_waits_for_every_output():
+    duration, time_to_speed, error = signals = calc_signals()
+    watcher = CalcWatcher(signals)
+
+    def calculate():
+        duration.put(1200)
+        time_to_speed.put(35)
+        # The error lands well after the timings
+        ttime.sleep(0.2)
+        error.put(3)
+
+    threading.Timer(0.05, calculate).start()
+    start = ttime.monotonic()
+    assert watcher.wait(timeout=2.0)
+    assert ttime.monotonic() - start >= 0.2
+    assert error.get() == 3
+    watcher.close()
+    assert not any(signal._callbacks["value"] for signal in signals)
+
+
+def test_calc_watcher_fresh_timestamp_same_value():
+    signals = calc_signals()
+    watcher = CalcWatcher(signals)
+    ttime.sleep(0.01)
+    for signal in signals:
+        signal.put(0, force=True, timestamp=ttime.time())
+    assert watcher.wait(timeout=1.0)
+    watcher.close()
+
+
+def test_calc_watcher_partial_output_times_out():
+    duration, time_to_speed, error = signals = calc_signals()
+    watcher = CalcWatcher(signals)
+    duration.put(1200)
+    time_to_speed.put(35)
+    assert not watcher.wait(timeout=0.1)
+    watcher.close()
+
+
+def test_calc_watcher_put_completion():
+    signals = calc_signals()
+    watcher = CalcWatcher(signals)
+    # A calculation repeating the previous results posts no output at all
+    threading.Timer(0.05, watcher.complete, kwargs={"pvname": "go"}).start()
+    start = ttime.monotonic()
+    assert watcher.wait(timeout=2.0)
+    assert ttime.monotonic() - start < 1.0
+    assert watcher.fresh == []
+    watcher.close()
+
+
+def test_calc_watcher_timeout():
+    watcher = CalcWatcher(calc_signals())
+    start = ttime.monotonic()
+    assert not watcher.wait(timeout=0.1)
+    assert ttime.monotonic() - start >= 0.1
+    watcher.close()
+
+
+def calc_vector(profile_cache, results):
+    """
+    A fake vector whose calc-only runs return ``results`` in turn.
+    """
+    signals = {
+        name: Signal(name=name, value=0)
+        for name in (
+            "sync",
+            "calc_only",
+            "expose",
+            "hold",
+            "exposure",
+            "num_samples",
+            "buffer_time",
+            "shutter_lag_time",
+            "shutter_time",
+            "error",
+            "data_acq_duration",
+            "max_time_to_speed",
+        )
+    }
+    motors = {
+        name: SimpleNamespace(
+            start=Signal(name=f"{name}_start"),
+            end=Signal(name=f"{name}_end"),
+            too_fast=Signal(name=f"{name}_too_fast", value=0),
+        )
+        for name in ("o", "x", "y", "z")
+    }
+    return fake_vector(
+        "check_move",
+        "_configure_move",
+        "run_segments",
+        "_run_segments",
+        "_mark_transition",
+        "_record_move",
+        **signals,
+        **motors,
+        config_cache=None,
+        profile_cache=profile_cache,
+        timeout_predictor=None,
+        ready=False,
+        _calculate_profile=lambda: (results.pop(0), True),
+    )
+
+
+def test_prepare_move_profile_cache():
+    cache = ProfileCache(maxsize=2)
+    ok = {"error": "0", "error_message": "None", "timeout": 12.5}
+    too_fast = {"error": "3", "error_message": "Too Fast"}
+    results = [dict(ok), dict(too_fast)]
+    vector = calc_vector(cache, results)
+
+    def prepare_move(o, exposure_ms=10):
+        VectorProgram.prepare_move(vector, o, (1, 1), (2, 2), (3, 3), exposure_ms, 100, 0, 2, 2)
+
+    prepare_move((0, 90))
+    # A raster line starting elsewhere has the same profile
+    vector.timeout = None
+    prepare_move((45, 135))
+    assert vector.timeout == 12.5 and vector.o.end.get() == 135
+    with pytest.raises(Exception, match="Too Fast"):
+        prepare_move((0, 90), exposure_ms=0.1)
+    with pytest.raises(Exception, match="Too Fast"):
+        prepare_move((0, 90), exposure_ms=0.1)
+    assert results == []
+    assert cache.stats()["hits"] == 2
+
+    vector.error._run_subs(sub_type=vector.error.SUB_META, connected=False)
+    assert len(cache) == 0
+
+
+def test_prepare_move_does_not_cache_stale_results():
+    cache = ProfileCache()
+    ok = {"error": "0", "error_message": "None", "timeout": 12.5}
+    vector = calc_vector(cache, [])
+    vector._calculate_profile = lambda: (dict(ok), False)
+    VectorProgram.prepare_move(vector, (0, 90), (1, 1), (2, 2), (3, 3), 10, 100, 0, 2, 2)
+    assert vector.ready and len(cache) == 0
+
+
+class CalcGo:
+    """
+    Go command of a fake IOC whose calculations complete the put after ``delay``.
+    """
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.puts = 0
+
+    def put(self, value, use_complete=False, callback=None):
+        self.puts += 1
+        if use_complete and callback is not None:
+            threading.Timer(self.delay, callback, kwargs={"pvname": "go"}).start()
+
+
+def test_prepare_move_caches_unchanged_calculation():
+    cache = ProfileCache()
+    vector = calc_vector(cache, [])
+    vector._calculate_profile = types.MethodType(VectorProgram._calculate_profile, vector)
+    vector.go = CalcGo()
+    vector.calc_timeout = 1.0
+    vector.data_acq_duration.put(1200)
+    vector.max_time_to_speed.put(35)
+
+    # error stays 0 and the timings repeat, so no output is posted
+    start = ttime.monotonic()
+    result = vector.check_move((0, 90), (1, 1), (2, 2), (3, 3), 10, 100, 0, 2, 2)
+    assert ttime.monotonic() - start < vector.calc_timeout
+    assert result["data_acq_duration"] == 1200 and len(cache) == 1
+    assert vector.check_move((0, 90), (1, 1), (2, 2), (3, 3), 10, 100, 0, 2, 2) == result
+    assert vector.go.puts == 1
+
+
+def test_calculate_profile_reports_too_fast_motors():
+    vector = calc_vector(None, [])
+    vector._calculate_profile = types.MethodType(VectorProgram._calculate_profile, vector)
+    vector.go = CalcGo()
+    vector.calc_timeout = 1.0
+    vector.error.put(3)
+    vector.x.too_fast.put(1)
+    result, landed = vector._calculate_profile()
+    assert landed and result["too_fast"] == ["x"]
+
+
+def test_profile_cache_keys_and_eviction():
+    cache = ProfileCache(maxsize=2, relative=False)
+    keys = [cache.key((start, start + 1), (0, 0), (0, 0), (0, 0), 10, 100) for start in range(3)]
+    assert len(set(keys)) == 3
+    for key in keys:
+        cache.put(key, {"error": "0"})
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == {"error": "0"}
+    assert cache.stats()["evictions"] == 1
+    relative = ProfileCache()
+    assert relative.key((0, 1), (0, 0), (0, 0), (0, 0), 10) == relative.key((5, 6), (1, 1), (2, 2), (3, 3), 10.0)
+
+
+def segment_vector(results, move_time=0.05):
+    """
+    A fake vector whose go command runs a move through Backup and Acquiring back to Idle.
+    """
+    vector = calc_vector(None, results)
+    vector.state = Signal(name="state", value="Idle")
+    vector.go = Signal(name="go", value=0)
+    vector.moves = []
+
+    def setpoints():
+        return {name: (getattr(vector, name).start.get(), getattr(vector, name).end.get()) for name in "oxyz"}
+
+    def run(started):
+        vector.state.put("Backup")
+        vector.state.put("Acquiring")
+        ttime.sleep(move_time)
+        vector.moves.append((started, setpoints()))
+        vector.state.put("Idle")
+
+    def on_go(value, **kwargs):
+        if not vector.calc_only.get():
+            threading.Thread(target=run, args=(setpoints(),)).start()
+
+    vector.go.subscribe(on_go, run=False)
+    return vector
+
+
+def test_state_watcher_sees_short_states():
+    state = Signal(name="state", value="Idle")
+    watcher = StateWatcher(state)
+    for value in ("Backup", "Acquiring", "Idle"):
+        state.put(value)
+    deadline = ttime.monotonic() + 0.1
+    assert watcher.wait_for("Acquiring", deadline)
+    assert watcher.wait_for("Idle", deadline)
+    assert not watcher.wait_for("Idle", deadline)
+    watcher.close()
+    assert not state._callbacks["value"]
+
+
+def segment(i, **kwargs):
+    return {
+        "o": (10 * i, 10 * i + 5),
+        "x": (i, i + 0.5),
+        "y": (2.0, 2.0),
+        "z": (-1.0, -1.0),
+        "exposure_ms": 10,
+        "num_samples": 5,
+        **kwargs,
+    }
+
+
+def test_run_segments_back_to_back():
+    ok = {"error": "0", "error_message": "None", "estimated_total_time_ms": 50, "timeout": 2.0}
+    vector = segment_vector([dict(ok) for _ in range(3)])
+    status = vector.run_segments([segment(i) for i in range(3)])
+    status.wait(5)
+    assert status.success
+    # Each segment ran from its own setpoints, and the next were loaded before it finished
+    assert [started for started, _ in vector.moves] == [
+        {name: segment(i)[name] for name in "oxyz"} for i in range(3)
+    ]
+    assert [loaded["o"] for _, loaded in vector.moves] == [(10, 15), (20, 25), (20, 25)]
+    assert vector.ready is False
+    assert not vector.state._callbacks["value"]
+
+
+def test_run_segments_requires_every_motor():
+    vector = segment_vector([])
+    incomplete = segment(1)
+    del incomplete["z"]
+    written = vector.z.start.timestamp, vector.z.end.timestamp
+    with pytest.raises(ValueError, match=r"segments \[1\]"):
+        vector.run_segments([segment(0), incomplete])
+    # Nothing was configured, not even for validation
+    assert (vector.z.start.timestamp, vector.z.end.timestamp) == written
+    assert vector.sync.get() == 0
+    assert vector.moves == []
+
+
+def test_run_segments_validates_up_front():
+    ok = {"error": "0", "error_message": "None", "estimated_total_time_ms": 50, "timeout": 2.0}
+    too_fast = {"error": "3", "error_message": "Too Fast"}
+    vector = segment_vector([dict(ok), too_fast])
+    with pytest.raises(ValueError, match=r"segments \[1\]"):
+        vector.run_segments([segment(0), segment(1, exposure_ms=1)])
+    assert vector.moves == []
+
+
+def test_run_segments_rejects_unlimited_model():
+    vector = segment_vector([])
+    with pytest.raises(ValueError, match="speed limits"):
+        vector.run_segments([segment(0)], model=VectorProfileModel())
+    assert vector.go.get() == 0
+
+
+def test_run_segments_timeout():
+    ok = {"error": "0", "error_message": "None", "estimated_total_time_ms": 50, "timeout": 0.1}
+    vector = segment_vector([ok], move_time=0.5)
+    status = vector.run_segments([segment(0)])
+    with pytest.raises(TimeoutError, match="segment 0"):
+        status.wait(5)
+
+
+def test_debug_signals_connect_on_demand():
+    vector = make_fake_device(VectorProgram)("TEST:", name="vector")
+    assert not any(name in vector.o._signals for name in MOTOR_DEBUG_SIGNALS)
+    assert vector.o.read_attrs == ["start", "end", "too_fast"]
+    assert "o.accel" not in vector.read_attrs
+    assert "accel" not in vector.o._signals
+
+    vector.x.des_speed.sim_put(3.5)
+    diagnostics = vector.diagnostics(timeout=1)
+    assert set(diagnostics) == {"o", "x", "y", "z"}
+    assert set(diagnostics["o"]) == set(MOTOR_DEBUG_SIGNALS)
+    assert diagnostics["x"]["des_speed"] == 3.5
+
+
+def test_debug_signals_eager(monkeypatch):
+    monkeypatch.setattr(VectorMotor, "lazy_diagnostics", False)
+    vector = make_fake_device(VectorProgram)("TEST:", name="vector")
+    assert all(name in vector.o._signals for name in MOTOR_DEBUG_SIGNALS)
+    assert "o.accel" in vector.read_attrs
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from ophyd import Signal
+
+from nyxtools.vector_profile import (
+    ERROR_NONE,
+    ERROR_TOO_FAST,
+    ERROR_ZERO_EXPOSURE,
+    MotorModel,
+    VectorProfileModel,
+    validate_queue,
+)
+
+
+def test_motor_profile():
+    profile = MotorModel(counts_per_unit=1000, accel=0.5).profile(10, 8, 200, 5, 2, 3)
+    assert profile["daq_dist"] == 2000
+    assert profile["des_speed"] == 10
+    assert profile["time_to_speed"] == 20
+    assert profile["speedup_dist"] == 100
+    assert profile["direction"] == -1
+    assert profile["backup_dist"] == 100 + 50 + 20 + 30
+
+
+def test_vector_profile_vectorized():
+    model = VectorProfileModel({"o": MotorModel(counts_per_unit=100, accel=0.1, max_speed=2)})
+    exposure_ms = np.array([[10.0], [20.0], [0.0]])
+    num_images = np.array([100, 1000])
+    profile = model.sweep(0, 90, exposure_ms, num_images)
+    assert profile["estimated_total_time_ms"].shape == (3, 2)
+    np.testing.assert_allclose(profile["data_acq_duration"], exposure_ms * num_images)
+    assert profile["error"].tolist() == [
+        [ERROR_TOO_FAST, ERROR_NONE],
+        [ERROR_TOO_FAST, ERROR_NONE],
+        [ERROR_ZERO_EXPOSURE, ERROR_ZERO_EXPOSURE],
+    ]
+    # The estimate used by VectorProgram.prepare_move
+    speed = 9000 / 10000
+    assert profile["estimated_total_time_ms"][0, 1] == 2 * speed / 0.1 + 2 * 2 + 10000
+    assert profile["timeout"][0, 1] == 5 * profile["estimated_total_time_ms"][0, 1] / 1000
+
+
+def test_calibrate_from_debug_pvs():
+    def motor(start, end, daq_dist, accel):
+        return SimpleNamespace(
+            **{
+                name: Signal(name=name, value=value)
+                for name, value in dict(start=start, end=end, daq_dist=daq_dist, accel=accel).items()
+            }
+        )
+
+    vector = SimpleNamespace(
+        o=motor(0, 10, 20000, 2.0), x=motor(1, 1, 0, 0.0), y=motor(0, 0.5, 500, 1.0), z=motor(0, 0, 0, 1.0)
+    )
+    model = VectorProfileModel.calibrate(vector, max_speeds={"o": 50})
+    assert model.motors["o"].counts_per_unit == 2000
+    assert model.motors["o"].max_speed == 50
+    assert model.motors["x"].counts_per_unit == 1.0
+    profile = model.profile((0, 10), (1, 1), (0, 0.5), (0, 0), 10, 100)
+    assert profile["o"]["daq_dist"] == 20000
+    assert profile["y"]["time_to_speed"] == 0.5
+    assert profile["max_time_to_speed"] == 10
+
+
+def queue():
+    return [
+        {"o": (0, 90), "exposure_ms": 10, "num_samples": 900},
+        {"o": (0, 90), "exposure_ms": 1, "num_samples": 90},
+        {"o": (10, 10.1), "x": (0, 0.2), "exposure_ms": 0, "num_samples": 1},
+    ]
+
+
+def test_validate_queue_with_model():
+    model = VectorProfileModel({"o": MotorModel(counts_per_unit=100, accel=0.1, max_speed=2)})
+    report = validate_queue(queue(), model=model)
+    assert report["feasible"].tolist() == [True, False, False]
+    assert report["error"].tolist() == [ERROR_NONE, ERROR_TOO_FAST, ERROR_ZERO_EXPOSURE]
+    assert report["data_acq_duration"][0] == 9000
+    assert report["estimated_total_time_ms"][0] == 2 * 10 + 4 + 9000
+    assert not report["ioc"].any()
+    with pytest.raises(ValueError):
+        validate_queue(queue())
+    # Without speed limits nothing would ever be Too Fast
+    unlimited = VectorProfileModel({"o": MotorModel(counts_per_unit=100, accel=0.1)})
+    assert not unlimited.speed_limited
+    with pytest.raises(ValueError, match="speed limits"):
+        validate_queue(queue(), model=unlimited)
+
+
+def test_validate_queue_with_ioc():
+    checked = []
+
+    def check_move(**job):
+        checked.append(job)
+        if job["exposure_ms"] == 1:
+            return {"error": "3", "error_message": "Too Fast"}
+        return {"error": "0", "timeout": 46.0, "estimated_total_time_ms": 9200, "data_acq_duration": 9000}
+
+    model = VectorProfileModel({"o": MotorModel(counts_per_unit=100, accel=0.1)})
+    report = validate_queue(queue()[:2], model=model, vector=SimpleNamespace(check_move=check_move))
+    assert report["feasible"].tolist() == [True, False]
+    assert report["timeout"][0] == 46.0 and np.isnan(report["timeout"][1])
+    assert report["ioc"].all()
+    assert checked[0]["shutter_time_ms"] == 2 and checked[0]["x"] == (0, 0)
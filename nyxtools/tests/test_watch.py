@@ -0,0 +1,49 @@
+import os
+import time as ttime
+
+from ophyd import Signal
+
+from nyxtools.watch import SweepWatcher, cbf_complete
+
+from .conftest import hide, reveal
+
+
+def test_cbf_complete(cbf_sweep, tmp_path):
+    paths, _ = cbf_sweep(num_images=1)
+    assert cbf_complete(paths[0])
+    assert not cbf_complete(tmp_path / "missing.cbf")
+    with open(paths[0], "r+b") as f:
+        f.truncate(os.path.getsize(paths[0]) - 40)
+    assert not cbf_complete(paths[0])
+
+
+def test_sweep_watcher_reports_frames_in_order(cbf_sweep, tmp_path):
+    paths, _ = cbf_sweep(num_images=3, file_number_start=5)
+    hide(paths)
+    watcher = SweepWatcher(tmp_path, "test", 5, 3, poll_interval=0.01, use_inotify=False)
+    assert watcher.poll() == []
+    assert watcher.wait(timeout=0.05) == []
+
+    reveal(paths[1])
+    assert watcher.poll() == []
+    reveal(paths[0])
+    assert watcher.poll() == [5, 6]
+    assert not watcher.done
+    reveal(paths[2])
+    assert list(watcher) == [7]
+    assert watcher.done
+    watcher.close()
+
+
+def test_sweep_watcher_counter_wakeup(cbf_sweep, tmp_path):
+    paths, _ = cbf_sweep(num_images=1)
+    hide(paths)
+    counter = Signal(name="array_counter", value=0)
+    watcher = SweepWatcher(tmp_path, "test", 1, 1, counter=counter, poll_interval=60, use_inotify=False)
+    reveal(paths[0])
+    counter.put(1)
+    start = ttime.monotonic()
+    assert watcher.wait(timeout=5) == [1]
+    assert ttime.monotonic() - start < 1
+    watcher.close()
+    assert not counter._callbacks["value"]
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import threading
+import time as ttime
+
+import numpy as np
+
+from .vector_profile import TIMEOUT_FACTOR
+
+logger = logging.getLogger(__name__)
+
+# Fields of a recorded vector move. Durations are in seconds from the go
+# command, NaN for a transition that was not seen
+MOVE_TIMING_DTYPE = np.dtype(
+    [
+        ("time", np.float64),
+        ("estimated_total_time_ms", np.float64),
+        ("data_acq_duration", np.float64),
+        ("max_time_to_speed", np.float64),
+        ("backup_s", np.float64),
+        ("acquiring_s", np.float64),
+        ("idle_s", np.float64),
+    ]
+)
+
+
+class MoveTimingStore:
+    """
+    Append-only JSON-lines file of the timings of vector moves.
+
+    Each record is written and flushed as one line, so an interrupted
+    process loses at most the move it was recording.
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        line = json.dumps({name: record.get(name, np.nan) for name in MOVE_TIMING_DTYPE.names})
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+            f.flush()
+
+    def load(self):
+        """
+        All the records as a MOVE_TIMING_DTYPE array; lines that cannot be parsed are skipped.
+        """
+        rows = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        rows.append(tuple(float(record.get(name, np.nan)) for name in MOVE_TIMING_DTYPE.names))
+                    except (ValueError, TypeError, AttributeError):
+                        logger.debug(f"MoveTimingStore: skipping {line!r}")
+        except FileNotFoundError:
+            pass
+        return np.array(rows, dtype=MOVE_TIMING_DTYPE)
+
+
+def regime(estimated_total_time_ms):
+    """
+    Duration regime of moves: the power of two of their estimated time in seconds.
+    """
+    return np.floor(np.log2(np.maximum(np.asarray(estimated_total_time_ms, dtype=float), 1.0) / 1000.0))
+
+
+class TimeoutPredictor:
+    """
+    Move timeouts learned from the recorded durations of previous moves.
+
+    Moves are grouped in regimes of similar estimated duration. Within a
+    regime the ratio of the real go-to-Idle time to the estimate is
+    modelled as normal, and the timeout is the estimate times the mean
+    ratio plus ``sigmas`` standard deviations, plus ``margin_s`` seconds.
+    Regimes with fewer than ``min_samples`` moves fall back to the
+    TIMEOUT_FACTOR heuristic of prepare_move, which also caps the timeout.
+    """
+
+    def __init__(self, store, min_samples=10, sigmas=6.0, margin_s=2.0):
+        self.store = store
+        self.min_samples = min_samples
+        self.sigmas = sigmas
+        self.margin_s = margin_s
+        self._timings = None
+        self._lock = threading.Lock()
+
+    @property
+    def timings(self):
+        with self._lock:
+            if self._timings is None:
+                self._timings = self.store.load()
+            return self._timings
+
+    def record(self, estimate, backup_s=np.nan, acquiring_s=np.nan, idle_s=np.nan):
+        """
+        Store the transition times, from the go command, of a move prepared as ``estimate``.
+        """
+        record = {
+            "time": ttime.time(),
+            "estimated_total_time_ms": estimate["estimated_total_time_ms"],
+            "data_acq_duration": estimate.get("data_acq_duration", np.nan),
+            "max_time_to_speed": estimate.get("max_time_to_speed", np.nan),
+            "backup_s": backup_s,
+            "acquiring_s": acquiring_s,
+            "idle_s": idle_s,
+        }
+        self.store.append(record)
+        row = np.array([tuple(record[name] for name in MOVE_TIMING_DTYPE.names)], dtype=MOVE_TIMING_DTYPE)
+        timings = self.timings
+        with self._lock:
+            self._timings = np.concatenate([timings, row])
+
+    def ratios(self, estimated_total_time_ms):
+        """
+        Recorded real/estimated duration ratios of completed moves in the regime of the estimate.
+        """
+        timings = self.timings
+        done = timings[np.isfinite(timings["idle_s"]) & (timings["estimated_total_time_ms"] > 0)]
+        done = done[regime(done["estimated_total_time_ms"]) == regime(estimated_total_time_ms)]
+        return done["idle_s"] / (done["estimated_total_time_ms"] / 1000.0)
+
+    def timeout(self, estimated_total_time_ms):
+        """
+        Timeout in seconds for a move estimated to take ``estimated_total_time_ms``.
+        """
+        heuristic = TIMEOUT_FACTOR * estimated_total_time_ms / 1000.0
+        ratios = self.ratios(estimated_total_time_ms)
+        if len(ratios) < self.min_samples:
+            return heuristic
+        ratio = ratios.mean() + self.sigmas * ratios.std(ddof=1)
+        return min(heuristic, ratio * estimated_total_time_ms / 1000.0 + self.margin_s)
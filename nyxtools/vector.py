@@ -1,15 +1,44 @@
 import logging
+import threading
 import time as ttime
 from typing import Tuple
 
+import numpy as np
 from ophyd import Component as Cpt
 from ophyd import Device, EpicsSignal, EpicsSignalRO
 from ophyd import FormattedComponent as FCpt
-from ophyd.status import SubscriptionStatus
+from ophyd import Kind
+from ophyd.device import do_not_wait_for_lazy_connection
+from ophyd.status import DeviceStatus, SubscriptionStatus
+
+from .configure import put_config
+from .ready import record_wait
+from .vector_profile import JOB_DEFAULTS, MOTOR_NAMES, TIMEOUT_FACTOR, validate_queue
 
 logger = logging.getLogger(__name__)
 logging.getLogger().setLevel(logging.DEBUG)
 
+# Upper bound of the wait for a calc-only run of the vector program (s)
+CALC_TIMEOUT = 1.0
+
+# Upper bound of the wait for the debug signals to connect in diagnostics (s)
+DIAGNOSTICS_TIMEOUT = 5.0
+
+
+# VectorMotor components reporting the calculated motion, only read when debugging
+MOTOR_DEBUG_SIGNALS = (
+    "accel",
+    "daq_dist",
+    "des_speed",
+    "time_to_speed",
+    "direction",
+    "speedup_dist",
+    "buffer_dist",
+    "shutter_open_dist",
+    "backup_dist",
+    "shutter_lag_dist",
+)
+
 
 class VectorSignalWithRBV(EpicsSignal):
     """
@@ -36,46 +65,164 @@ class VectorMotor(Device):
     # Status
     #
 
-    # If true, indicates that the requested motion exceeds the max speed for this motor
+    # If true, indicates that the requested motion exceeds the max speed for this motor.
+    # Connected eagerly, unlike the debug signals below: every calc-only run
+    # watches it, and check_move reads it to report which motors are too fast
     too_fast = FCpt(EpicsSignalRO, "{prefix}Sts:{motor_name}TooFast-Sts")
 
     #
     # Debugging: calculated motion characteristics
     #
+    # These are only connected when first used, e.g. by
+    # VectorProgram.diagnostics(), and are left out of read(). With
+    # lazy_diagnostics False they are connected and read with the rest.
+    #
 
     # Acceleration (ct/ms^2)
-    accel = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}Accel-I")
+    accel = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}Accel-I", lazy=True, kind="omitted")
 
     # Distance travelled during data acquisition motion (ct)
-    daq_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}DataAcqDist-I")
+    daq_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}DataAcqDist-I", lazy=True, kind="omitted")
 
     # Desired speed (ct/ms)
-    des_speed = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}DesSpeed-I")
+    des_speed = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}DesSpeed-I", lazy=True, kind="omitted")
 
     # Time it will take to reach the desired speed (ms)
-    time_to_speed = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}TimeToSpeed-I")
+    time_to_speed = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}TimeToSpeed-I", lazy=True, kind="omitted")
 
     # Motion direction (+1 or -1)
-    direction = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}Dir-I")
+    direction = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}Dir-I", lazy=True, kind="omitted")
 
     # Distance travelled during speedup motion (ct)
-    speedup_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}SpeedUpDist-I")
+    speedup_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}SpeedUpDist-I", lazy=True, kind="omitted")
 
     # Distance travelled during buffer motion (ct)
-    buffer_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}BufferDist-I")
+    buffer_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}BufferDist-I", lazy=True, kind="omitted")
 
     # Distance travelled while the shutter is opening  (ct)
-    shutter_open_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}ShutOpenDist-I")
+    shutter_open_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}ShutOpenDist-I", lazy=True, kind="omitted")
 
     # Distance travelled during backup motion (ct)
-    backup_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}BackUpDist-I")
+    backup_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}BackUpDist-I", lazy=True, kind="omitted")
 
     # Distance travelled while waiting for the shutter lag (ct)
-    shutter_lag_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}ShutLagDist-I")
+    shutter_lag_dist = FCpt(EpicsSignalRO, "{prefix}Val:{motor_name}ShutLagDist-I", lazy=True, kind="omitted")
+
+    # Set to False, before the device is created, to connect and read the
+    # debug signals with the rest of the motor
+    lazy_diagnostics = True
 
     def __init__(self, prefix, motor_name=None, **kwargs):
         self.motor_name = motor_name
         super().__init__(prefix, **kwargs)
+        if not self.lazy_diagnostics:
+            with do_not_wait_for_lazy_connection(self):
+                for name in MOTOR_DEBUG_SIGNALS:
+                    getattr(self, name).kind = Kind.normal
+
+
+class CalcWatcher:
+    """
+    Detects the end of a vector calculation.
+
+    The calculation is over when the put of its go command completes, which
+    ``complete`` is the put callback for. The outputs alone cannot tell: the
+    IOC only posts those whose value changed, so error stays silent for
+    every valid move, as do the timings of a repeated one. For an IOC that
+    does not report put completion, the calculation also counts as over
+    once every one of ``signals`` has had fresh output, an update with
+    another timestamp or value than when the watcher was made.
+    """
+
+    def __init__(self, signals):
+        self._baseline = {}
+        self._pending = set()
+        self._landed = threading.Event()
+        self._lock = threading.Lock()
+        self._tokens = [(signal, signal.subscribe(self._on_update, run=False)) for signal in signals]
+        for signal in signals:
+            reading = signal.read()[signal.name]
+            with self._lock:
+                self._baseline[signal.name] = (reading["timestamp"], reading["value"])
+                self._pending.add(signal.name)
+
+    @property
+    def fresh(self):
+        """
+        Names of the signals that have had fresh output.
+        """
+        with self._lock:
+            return sorted(set(self._baseline) - self._pending)
+
+    def complete(self, **kwargs):
+        """
+        Put callback of the go command, called once the calculation has run.
+        """
+        self._landed.set()
+
+    def _on_update(self, value=None, timestamp=None, obj=None, **kwargs):
+        with self._lock:
+            baseline = self._baseline.get(obj.name)
+            if baseline is None or baseline == (timestamp, value):
+                return
+            self._pending.discard(obj.name)
+            if self._pending:
+                return
+        self._landed.set()
+
+    def wait(self, timeout=CALC_TIMEOUT):
+        """
+        Wait for the calculation to end, returning False if it did not within ``timeout``.
+        """
+        return self._landed.wait(timeout)
+
+    def close(self):
+        for signal, token in self._tokens:
+            signal.unsubscribe(token)
+        self._tokens = []
+
+
+class StateWatcher:
+    """
+    Records the states a vector program goes through, for a thread to wait on.
+
+    Every state update is kept, so a short move that passes through a state
+    before the waiting thread looks for it is not missed. Each ``wait_for``
+    only considers the states reached after the one the previous wait found.
+    """
+
+    def __init__(self, signal):
+        self._signal = signal
+        self._states = []
+        self._cursor = 0
+        self._changed = threading.Condition()
+        self._token = signal.subscribe(self._on_state, run=False)
+
+    def _on_state(self, value=None, **kwargs):
+        with self._changed:
+            self._states.append(value)
+            self._changed.notify_all()
+
+    def wait_for(self, state, deadline):
+        """
+        Wait for ``state``, until the monotonic time ``deadline``; returns False if it was not reached.
+        """
+        with self._changed:
+            while True:
+                try:
+                    self._cursor = self._states.index(state, self._cursor) + 1
+                    return True
+                except ValueError:
+                    pass
+                remaining = deadline - ttime.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+
+    def close(self):
+        if self._token is not None:
+            self._signal.unsubscribe(self._token)
+            self._token = None
 
 
 class VectorProgram(Device):
@@ -83,8 +230,27 @@ class VectorProgram(Device):
     Wraps PVs that control the vector program.
     """
 
+    # Optional nyxtools.configure.ConfigCache skipping setpoint puts that would
+    # not change anything
+    config_cache = None
+
+    # Upper bound of the wait for the calc-only run in prepare_move (s)
+    calc_timeout = CALC_TIMEOUT
+
+    # Optional nyxtools.vector_profile.ProfileCache of calc-only results, which
+    # lets prepare_move skip the calculation for moves it has already checked
+    profile_cache = None
+
+    # Optional nyxtools.timeouts.TimeoutPredictor, recording the duration of
+    # every move and setting the timeout from the durations of past ones
+    timeout_predictor = None
+
     def __init__(self, *args, **kwargs):
         self.ready = False
+        self.timeout = None
+        self._estimate = None
+        self._go_time = None
+        self._move_times = {}
         super().__init__(*args, **kwargs)
 
     #
@@ -187,19 +353,79 @@ class VectorProgram(Device):
         shutter_lag_time_ms: float,
         shutter_time_ms: float,
     ):
+        result = self.check_move(
+            o, x, y, z, exposure_ms, num_samples, buffer_time_ms, shutter_lag_time_ms, shutter_time_ms
+        )
+        if result["error"] != "0":
+            raise Exception(
+                f"\nFailed to run vector.\nError: {result['error']}\n" f"Error message: {result['error_message']}"
+            )
+
+        self.timeout = result["timeout"]
+        if self.timeout_predictor is not None:
+            self.timeout = self.timeout_predictor.timeout(result["estimated_total_time_ms"])
+        self._estimate = result
+        self.ready = True
+
+    def check_move(
+        self,
+        o: Tuple[float, float],
+        x: Tuple[float, float],
+        y: Tuple[float, float],
+        z: Tuple[float, float],
+        exposure_ms: float,
+        num_samples: float,
+        buffer_time_ms: float,
+        shutter_lag_time_ms: float,
+        shutter_time_ms: float,
+    ):
+        """
+        Configure a move and calculate it in calc-only mode, without raising on errors.
+
+        Returns the error, error message and, for a valid move, the timing
+        results prepare_move uses. The move still has to be prepared before
+        it can be run.
+        """
+        self.ready = False
 
         # Configure motion
         self.sync.put(1)
 
         self.calc_only.put(True)
-        self.expose.put(True)
-        self.hold.put(False)
-
-        self.exposure.put(exposure_ms)
-        self.num_samples.put(num_samples)
-        self.buffer_time.put(buffer_time_ms)
-        self.shutter_lag_time.put(shutter_lag_time_ms)
-        self.shutter_time.put(shutter_time_ms)
+        self._configure_move(
+            o, x, y, z, exposure_ms, num_samples, buffer_time_ms, shutter_lag_time_ms, shutter_time_ms
+        )
+
+        result = None
+        if self.profile_cache is not None:
+            self.profile_cache.watch(self.error)
+            key = self.profile_cache.key(
+                o, x, y, z, exposure_ms, num_samples, buffer_time_ms, shutter_lag_time_ms, shutter_time_ms
+            )
+            result = self.profile_cache.get(key)
+        if result is None:
+            result, landed = self._calculate_profile()
+            # If the calculation was not seen to end, the result may be left
+            # over from the previous one, and must not be kept for this move
+            if self.profile_cache is not None and landed:
+                self.profile_cache.put(key, result)
+        return result
+
+    def _configure_move(
+        self, o, x, y, z, exposure_ms, num_samples, buffer_time_ms, shutter_lag_time_ms, shutter_time_ms
+    ):
+        put_config(
+            self.config_cache,
+            [
+                (self.expose, True),
+                (self.hold, False),
+                (self.exposure, exposure_ms),
+                (self.num_samples, num_samples),
+                (self.buffer_time, buffer_time_ms),
+                (self.shutter_lag_time, shutter_lag_time_ms),
+                (self.shutter_time, shutter_time_ms),
+            ],
+        )
 
         self.o.start.put(o[0])
         self.o.end.put(o[1])
@@ -213,18 +439,38 @@ class VectorProgram(Device):
         self.z.start.put(z[0])
         self.z.end.put(z[1])
 
-        # Start "motion"
-        self.go.put(1)
-
-        # There's no way to know it is done, so wait a little, it should be very fast
-        ttime.sleep(1.0)
+    def _calculate_profile(self):
+        """
+        Run the calc-only vector program and collect the results prepare_move needs.
+
+        Returns the results, and whether the calculation was seen to end
+        before they were read. The results of an invalid move name the
+        motors reported too fast.
+        """
+        # Start "motion". The put completes once the IOC has processed the
+        # calculation, so the wait normally ends well before calc_timeout
+        start = ttime.monotonic()
+        too_fast = [getattr(self, name).too_fast for name in MOTOR_NAMES]
+        watcher = CalcWatcher([self.data_acq_duration, self.max_time_to_speed, self.error, *too_fast])
+        try:
+            self.go.put(1, use_complete=True, callback=watcher.complete)
+            landed = watcher.wait(self.calc_timeout)
+        finally:
+            watcher.close()
+        elapsed = ttime.monotonic() - start
+        logger.debug(
+            f"prepare_move: calculation {'landed' if landed else 'not seen'} after {elapsed:.3f} s, "
+            f"fresh output on {watcher.fresh}"
+        )
+        record_wait("vector_calc", elapsed, landed)
 
         # Check for errors
         error = str(self.error.get())
         error_message = self.error.get(as_string=True)
-
+        result = {"error": error, "error_message": error_message}
         if error != "0":
-            raise Exception(f"\nFailed to run vector.\nError: {error}\n" f"Error message: {error_message}")
+            result["too_fast"] = [name for name, signal in zip(MOTOR_NAMES, too_fast) if signal.get()]
+            return result, landed
 
         # Estimate total motion time (in ms)
 
@@ -234,8 +480,33 @@ class VectorProgram(Device):
         daq_duration = int(self.data_acq_duration.get())
 
         estimated_total_time_ms = 2 * time_to_speed + buffer_time + 2 * shutter_time + daq_duration
-        self.timeout = 5 * estimated_total_time_ms / 1000.0
-        self.ready = True
+        result.update(
+            max_time_to_speed=time_to_speed,
+            data_acq_duration=daq_duration,
+            estimated_total_time_ms=estimated_total_time_ms,
+            timeout=TIMEOUT_FACTOR * estimated_total_time_ms / 1000.0,
+        )
+        return result, landed
+
+    def diagnostics(self, timeout=DIAGNOSTICS_TIMEOUT):
+        """
+        Snapshot of the calculated motion characteristics, as {motor name: {signal name: value}}.
+
+        Debug signals that are not connected yet are all created before
+        waiting on any of them, so their connections are made in parallel.
+        """
+        signals = {}
+        for name in MOTOR_NAMES:
+            motor = getattr(self, name)
+            with do_not_wait_for_lazy_connection(motor):
+                signals[name] = {attr: getattr(motor, attr) for attr in MOTOR_DEBUG_SIGNALS}
+        for motor_signals in signals.values():
+            for signal in motor_signals.values():
+                signal.wait_for_connection(timeout)
+        return {
+            name: {attr: signal.get() for attr, signal in motor_signals.items()}
+            for name, motor_signals in signals.items()
+        }
 
     def move(self):
         logger.debug("move: start")
@@ -254,8 +525,12 @@ class VectorProgram(Device):
         #                               name='vector_active', parent='vector', value=0,
         #                               timestamp=1638904545.824989, auto_monitor=False,
         #                               string=False)}
+        self._go_time = None
+        self._move_times = {}
+
         def start_callback(value, old_value, **kwargs):
             logger.debug(f"move start_callback: {old_value} -> {value}")
+            self._mark_transition(value)
             if (old_value == "Backup" and value == "Acquiring") or (old_value == "Idle" and value == "Acquiring"):
                 logger.debug(f"move start_callback: Successfully changed {old_value} -> {value}")
                 return True
@@ -266,6 +541,7 @@ class VectorProgram(Device):
         run_status = SubscriptionStatus(self.state, start_callback, run=True)
         logger.debug(f"Subscribed to {self.active.name}")
 
+        self._go_time = ttime.monotonic()
         self.go.put(1)
         logger.debug("Go.put(1)")
 
@@ -278,11 +554,120 @@ class VectorProgram(Device):
             logger.debug(f"track_move finished_callback: {old_value} -> {value}")
             if old_value == "Acquiring" and value == "Idle":
                 logger.debug(f"track_move finished_callback: Successfully changed {old_value} -> {value}")
+                self._mark_transition(value)
+                self._record_move()
                 return True
             else:
                 logger.debug(f"track_move finished_callback: Changing {old_value} -> {value}...")
                 return False
 
-        run_status = SubscriptionStatus(self.state, finished_callback, run=True)
+        # The timeout of the move prepared last, learned from past moves if
+        # there is a timeout_predictor
+        run_status = SubscriptionStatus(self.state, finished_callback, run=True, timeout=self.timeout)
         logger.debug(f"Subscribed to {self.state.name}")
         return run_status
+
+    def run_segments(self, segments, model=None):
+        """
+        Run a queue of vector moves back to back.
+
+        ``segments`` are dicts of prepare_move arguments. Every segment must
+        give the start and end of all the motors, o, x, y and z, as these are
+        absolute positions; only the timing arguments in JOB_DEFAULTS may be
+        left out. All segments are validated before the
+        first one starts: by ``model``, a calibrated VectorProfileModel with
+        motor speed limits, if given, and by the IOC in calc-only mode
+        otherwise. A queue with an infeasible segment raises ValueError and
+        nothing moves, as does a model without speed limits.
+
+        Each segment is started as soon as the previous one is back to Idle.
+        The setpoints of the next segment are written while the current one
+        is acquiring, which relies on the IOC latching its setpoints at the
+        go command, so that only the go remains between segments. Returns a
+        status that finishes when the last segment is back to Idle, or fails
+        on the first segment that does not get there within its timeout.
+        """
+        incomplete = [i for i, segment in enumerate(segments) if not all(name in segment for name in MOTOR_NAMES)]
+        if incomplete:
+            raise ValueError(
+                f"run_segments: segments {incomplete} do not give the positions of all of {MOTOR_NAMES}"
+            )
+        segments = [{**JOB_DEFAULTS, **segment} for segment in segments]
+        report = validate_queue(segments, model=model, vector=None if model is not None else self)
+        infeasible = np.flatnonzero(~report["feasible"])
+        if len(infeasible):
+            raise ValueError(
+                f"run_segments: segments {infeasible.tolist()} are infeasible, "
+                f"errors {report['error'][infeasible].tolist()}"
+            )
+
+        estimates = [
+            {
+                name: float(row[name])
+                for name in ("estimated_total_time_ms", "data_acq_duration", "max_time_to_speed", "timeout")
+            }
+            for row in report
+        ]
+        if self.timeout_predictor is not None:
+            for estimate in estimates:
+                estimate["timeout"] = self.timeout_predictor.timeout(estimate["estimated_total_time_ms"])
+
+        status = DeviceStatus(self)
+        threading.Thread(
+            target=self._run_segments, args=(segments, estimates, status), name="vector_segments", daemon=True
+        ).start()
+        return status
+
+    def _run_segments(self, segments, estimates, status):
+        watcher = StateWatcher(self.state)
+        try:
+            self._configure_move(**segments[0])
+            self.calc_only.put(False)
+            for i, estimate in enumerate(estimates):
+                self._estimate = estimate
+                self._move_times = {}
+                self._go_time = ttime.monotonic()
+                deadline = self._go_time + estimate["timeout"]
+                self.go.put(1)
+                if not watcher.wait_for("Acquiring", deadline):
+                    raise TimeoutError(f"run_segments: segment {i} did not start acquiring")
+                self._mark_transition("Acquiring")
+
+                if i + 1 < len(segments):
+                    self._configure_move(**segments[i + 1])
+
+                if not watcher.wait_for("Idle", deadline):
+                    raise TimeoutError(f"run_segments: segment {i} did not finish in {estimate['timeout']:.1f} s")
+                self._mark_transition("Idle")
+                self._record_move()
+                logger.debug(f"run_segments: segment {i} done in {self._move_times['Idle']:.3f} s")
+        except Exception as exc:
+            status.set_exception(exc)
+        else:
+            status.set_finished()
+        finally:
+            watcher.close()
+            # The setpoints are those of the last segment, not a prepared move
+            self.ready = False
+
+    def _mark_transition(self, state):
+        # Seconds from the go command to the first time the move reaches each state
+        if self._go_time is not None and state not in self._move_times:
+            self._move_times[state] = ttime.monotonic() - self._go_time
+
+    def _record_move(self):
+        if self.timeout_predictor is None or self._estimate is None or self._go_time is None:
+            return
+        # Runs in the status callbacks of the move, so a failure to store the
+        # timing, e.g. on a full disk, must not fail the move itself
+        try:
+            self.timeout_predictor.record(
+                self._estimate,
+                backup_s=self._move_times.get("Backup", np.nan),
+                acquiring_s=self._move_times.get("Acquiring", np.nan),
+                idle_s=self._move_times.get("Idle", np.nan),
+            )
+        except Exception as exc:
+            logger.warning(f"Could not record the timing of the vector move: {exc}")
+        finally:
+            self._go_time = None
@@ -0,0 +1,370 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MOTOR_NAMES = ("o", "x", "y", "z")
+
+# Values of VectorProgram.error
+ERROR_NONE = 0
+ERROR_ABORTED = 1
+ERROR_ZERO_EXPOSURE = 2
+ERROR_TOO_FAST = 3
+ERROR_ZERO_SHUTTER = 4
+ERROR_TOO_SLOW = 5
+
+# Safety factor applied to the estimated motion time by prepare_move
+TIMEOUT_FACTOR = 5
+
+
+class MotorModel:
+    """
+    Motion of one vector motor as planned by the vector program.
+
+    ``counts_per_unit`` converts the motor's EGU into the encoder counts of
+    the IOC's debug PVs and ``accel`` is its acceleration (ct/ms^2). Speeds
+    (ct/ms) above ``max_speed`` or, for a moving motor, below ``min_speed``
+    are rejected by the program.
+    """
+
+    def __init__(self, counts_per_unit=1.0, accel=1.0, max_speed=np.inf, min_speed=0.0):
+        self.counts_per_unit = counts_per_unit
+        self.accel = accel
+        self.max_speed = max_speed
+        self.min_speed = min_speed
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(counts_per_unit={self.counts_per_unit}, accel={self.accel}, "
+            f"max_speed={self.max_speed}, min_speed={self.min_speed})"
+        )
+
+    def profile(self, start, end, daq_duration, buffer_time, shutter_lag_time, shutter_time):
+        """
+        The VectorMotor debug quantities for moves from ``start`` to ``end``.
+
+        Takes arrays (or scalars) that broadcast together, and returns a dict
+        of arrays named after the VectorMotor signals. Times are in ms.
+        """
+        start, end, daq_duration = np.broadcast_arrays(
+            np.asarray(start, dtype=float), np.asarray(end, dtype=float), np.asarray(daq_duration, dtype=float)
+        )
+        daq_dist = np.abs(end - start) * self.counts_per_unit
+        des_speed = np.divide(daq_dist, daq_duration, out=np.zeros_like(daq_dist), where=daq_duration > 0)
+        if self.accel > 0:
+            time_to_speed = des_speed / self.accel
+        else:
+            time_to_speed = np.zeros_like(des_speed)
+        speedup_dist = 0.5 * des_speed * time_to_speed
+        buffer_dist = des_speed * buffer_time
+        shutter_lag_dist = des_speed * shutter_lag_time
+        shutter_open_dist = des_speed * shutter_time
+        return {
+            "accel": np.full_like(des_speed, self.accel),
+            "daq_dist": daq_dist,
+            "des_speed": des_speed,
+            "time_to_speed": time_to_speed,
+            "direction": np.where(end < start, -1, 1),
+            "speedup_dist": speedup_dist,
+            "buffer_dist": buffer_dist,
+            "shutter_open_dist": shutter_open_dist,
+            # Backs up far enough to be at speed, past the buffer and with the
+            # shutter open, when it reaches the start position
+            "backup_dist": speedup_dist + buffer_dist + shutter_lag_dist + shutter_open_dist,
+            "shutter_lag_dist": shutter_lag_dist,
+            "too_fast": des_speed > self.max_speed,
+            "too_slow": (daq_dist > 0) & (des_speed < self.min_speed),
+        }
+
+
+class VectorProfileModel:
+    """
+    Client-side model of the profile computed by the vector program.
+
+    Predicts, without an IOC round-trip, the per-motor quantities of the
+    VectorMotor debug PVs, ``data_acq_duration``, ``max_time_to_speed``,
+    the error the program would report and the ``estimated_total_time_ms``
+    of VectorProgram.prepare_move. All parameters broadcast, so one call
+    checks any number of candidate moves. ``calibrate`` takes the motor
+    scales and accelerations from a calculation made by the IOC.
+    """
+
+    def __init__(self, motors=None):
+        self.motors = {name: MotorModel() for name in MOTOR_NAMES}
+        self.motors.update(motors or {})
+
+    def __repr__(self):
+        return f"{type(self).__name__}(motors={self.motors})"
+
+    @property
+    def speed_limited(self):
+        """
+        True if a motor has a max_speed, without which Too Fast is never predicted.
+        """
+        return any(np.isfinite(motor.max_speed) for motor in self.motors.values())
+
+    @classmethod
+    def calibrate(cls, vector, max_speeds=None, min_speeds=None):
+        """
+        Model calibrated from the debug PVs of the last calculation of ``vector``.
+
+        Motors that did not move in that calculation keep a scale of 1. The
+        IOC does not publish the speed limits of the motors, so they must be
+        given in ``max_speeds`` and ``min_speeds`` (ct/ms) for the model to
+        predict Too Fast and Too Slow.
+        """
+        max_speeds = max_speeds or {}
+        min_speeds = min_speeds or {}
+        motors = {}
+        for name in MOTOR_NAMES:
+            motor = getattr(vector, name)
+            distance = abs(motor.end.get() - motor.start.get())
+            daq_dist = motor.daq_dist.get()
+            motors[name] = MotorModel(
+                counts_per_unit=daq_dist / distance if distance > 0 and daq_dist > 0 else 1.0,
+                accel=motor.accel.get(),
+                max_speed=max_speeds.get(name, np.inf),
+                min_speed=min_speeds.get(name, 0.0),
+            )
+        return cls(motors)
+
+    def profile(
+        self,
+        o,
+        x,
+        y,
+        z,
+        exposure_ms,
+        num_samples,
+        buffer_time_ms=0,
+        shutter_lag_time_ms=2,
+        shutter_time_ms=2,
+    ):
+        """
+        Predict the profile for the arguments of VectorProgram.prepare_move.
+
+        Returns a dict of arrays with the program-level quantities, plus one
+        dict per motor from MotorModel.profile under the motor names.
+        """
+        exposure_ms, num_samples, buffer_time_ms, shutter_lag_time_ms, shutter_time_ms = (
+            np.asarray(value, dtype=float)
+            for value in (exposure_ms, num_samples, buffer_time_ms, shutter_lag_time_ms, shutter_time_ms)
+        )
+        data_acq_duration = exposure_ms * num_samples
+        motors = {
+            name: self.motors[name].profile(
+                start, end, data_acq_duration, buffer_time_ms, shutter_lag_time_ms, shutter_time_ms
+            )
+            for name, (start, end) in zip(MOTOR_NAMES, (o, x, y, z))
+        }
+        max_time_to_speed = np.max([motor["time_to_speed"] for motor in motors.values()], axis=0)
+        too_fast = np.any([motor["too_fast"] for motor in motors.values()], axis=0)
+        too_slow = np.any([motor["too_slow"] for motor in motors.values()], axis=0)
+
+        error = np.select(
+            [exposure_ms <= 0, too_fast, shutter_time_ms <= 0, too_slow],
+            [ERROR_ZERO_EXPOSURE, ERROR_TOO_FAST, ERROR_ZERO_SHUTTER, ERROR_TOO_SLOW],
+            ERROR_NONE,
+        )
+        estimated_total_time_ms = 2 * max_time_to_speed + buffer_time_ms + 2 * shutter_time_ms + data_acq_duration
+        return {
+            "data_acq_duration": data_acq_duration * np.ones_like(max_time_to_speed),
+            "max_time_to_speed": max_time_to_speed,
+            "error": error,
+            "estimated_total_time_ms": estimated_total_time_ms,
+            "timeout": TIMEOUT_FACTOR * estimated_total_time_ms / 1000.0,
+            **motors,
+        }
+
+    def sweep(
+        self,
+        angle_start,
+        scan_width,
+        exposure_ms,
+        num_images,
+        x=(0, 0),
+        y=(0, 0),
+        z=(0, 0),
+        buffer_time_ms=0,
+        shutter_lag_time_ms=2,
+        shutter_time_ms=2,
+    ):
+        """
+        Predict the profile of rotation sweeps, as set up by the flyers' configure_vector.
+        """
+        angle_start = np.asarray(angle_start, dtype=float)
+        return self.profile(
+            (angle_start, angle_start + scan_width),
+            x,
+            y,
+            z,
+            exposure_ms,
+            num_images,
+            buffer_time_ms,
+            shutter_lag_time_ms,
+            shutter_time_ms,
+        )
+
+
+class ProfileCache:
+    """
+    LRU cache of the calc-only results of VectorProgram.prepare_move.
+
+    Results are keyed by the move parameters. With ``relative`` (the
+    default) motor positions are only matched by their travel, end - start:
+    the program's speeds, times and errors depend on the distances alone,
+    so moves that are translated copies of each other, such as raster
+    lines, share an entry. Positions are compared at ``decimals`` places.
+
+    The cache is cleared when a watched signal of the vector IOC
+    disconnects, as a restarted IOC may have been reconfigured.
+    """
+
+    def __init__(self, maxsize=256, relative=True, decimals=6):
+        self.maxsize = maxsize
+        self.relative = relative
+        self.decimals = decimals
+        self._entries = OrderedDict()
+        self._watched = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, o, x, y, z, *timings):
+        positions = []
+        for start, end in (o, x, y, z):
+            if self.relative:
+                positions.append(round(end - start, self.decimals))
+            else:
+                positions.append((round(start, self.decimals), round(end, self.decimals)))
+        return (*positions, *(round(value, self.decimals) for value in timings))
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(result)
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = dict(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def watch(self, signal):
+        """
+        Invalidate the cache whenever ``signal`` loses its connection.
+        """
+        if signal not in self._watched:
+            self._watched[signal] = signal.subscribe(self._on_meta, event_type=signal.SUB_META, run=False)
+
+    def _on_meta(self, connected=True, **kwargs):
+        if not connected:
+            logger.info("ProfileCache: vector IOC disconnected, invalidating")
+            self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+# Arguments of VectorProgram.prepare_move that a queued job may leave out,
+# with the values the flyers' configure_vector uses
+JOB_DEFAULTS = {
+    "x": (0, 0),
+    "y": (0, 0),
+    "z": (0, 0),
+    "buffer_time_ms": 0,
+    "shutter_lag_time_ms": 2,
+    "shutter_time_ms": 2,
+}
+
+QUEUE_REPORT_DTYPE = np.dtype(
+    [
+        ("feasible", bool),
+        ("error", np.int16),
+        ("data_acq_duration", np.float64),
+        ("max_time_to_speed", np.float64),
+        ("estimated_total_time_ms", np.float64),
+        ("timeout", np.float64),
+        # True where the row holds the IOC's calculation rather than the model's
+        ("ioc", bool),
+    ]
+)
+
+
+def validate_queue(jobs, model=None, vector=None):
+    """
+    Check a queue of vector moves before collecting any of them.
+
+    ``jobs`` are dicts of VectorProgram.prepare_move arguments; those in
+    JOB_DEFAULTS may be left out. The profiles of all jobs are predicted
+    by ``model`` in a single vectorized call. With a ``vector``, every job
+    is also calculated by the IOC in calc-only mode, through its profile
+    cache if it has one, and the IOC's results replace the predictions.
+
+    A model without motor speed limits, see VectorProfileModel.speed_limited,
+    would pass every Too Fast job, so it raises ValueError unless the IOC
+    checks the jobs as well.
+
+    Returns one QUEUE_REPORT_DTYPE row per job, in queue order.
+    """
+    if model is None and vector is None:
+        raise ValueError("validate_queue needs a model, a vector or both")
+    if model is not None and vector is None and not model.speed_limited:
+        raise ValueError("validate_queue: the model has no motor speed limits and cannot predict Too Fast")
+    jobs = [{**JOB_DEFAULTS, **job} for job in jobs]
+    report = np.zeros(len(jobs), dtype=QUEUE_REPORT_DTYPE)
+    report["error"] = -1
+    for name in ("data_acq_duration", "max_time_to_speed", "estimated_total_time_ms", "timeout"):
+        report[name] = np.nan
+
+    if model is not None and jobs:
+        positions = [
+            tuple(np.array([job[name][i] for job in jobs], dtype=float) for i in range(2)) for name in MOTOR_NAMES
+        ]
+        timings = [
+            np.array([job[name] for job in jobs], dtype=float)
+            for name in ("exposure_ms", "num_samples", "buffer_time_ms", "shutter_lag_time_ms", "shutter_time_ms")
+        ]
+        profile = model.profile(*positions, *timings)
+        for name in report.dtype.names:
+            if name in profile:
+                report[name] = profile[name]
+
+    if vector is not None:
+        for i, job in enumerate(jobs):
+            result = vector.check_move(**job)
+            report["error"][i] = int(result["error"])
+            for name in ("data_acq_duration", "max_time_to_speed", "estimated_total_time_ms", "timeout"):
+                report[name][i] = result.get(name, np.nan)
+        report["ioc"] = True
+
+    report["feasible"] = report["error"] == ERROR_NONE
+    return report
@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time as ttime
+
+from .cbf import CBF_BINARY_SECTION
+from .sweep import sweep_paths
+
+try:
+    import inotify_simple
+except ImportError:
+    # Without inotify the pending frames are polled
+    inotify_simple = None
+
+logger = logging.getLogger(__name__)
+
+# The closing MIME boundary, the last thing written to a complete CBF
+CBF_TRAILER = CBF_BINARY_SECTION + b"--"
+
+# Number of bytes at the end of the file searched for the trailer
+TRAILER_WINDOW = 64
+
+
+def cbf_complete(fpath):
+    """
+    True once the CBF file has been written up to its closing MIME boundary.
+    """
+    try:
+        with open(fpath, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - TRAILER_WINDOW))
+            return CBF_TRAILER in f.read()
+    except FileNotFoundError:
+        return False
+
+
+class SweepWatcher:
+    """
+    Reports the frames of a sweep, in order, as their CBF files are completed.
+
+    The data directory is watched with inotify where ``inotify_simple`` is
+    installed, and the next pending file is polled every ``poll_interval``
+    otherwise. A detector counter signal (e.g. ``cam.array_counter``) can be
+    given to wake the poller as soon as the detector reports a new frame.
+    A frame counts as complete once its CBF trailer has been written.
+    """
+
+    def __init__(
+        self,
+        data_directory_name,
+        file_prefix,
+        file_number_start,
+        num_images,
+        counter=None,
+        poll_interval=0.1,
+        use_inotify=True,
+    ):
+        self.file_number_start = file_number_start
+        self.num_images = num_images
+        self.poll_interval = poll_interval
+        self._paths = sweep_paths(data_directory_name, file_prefix, file_number_start, num_images)
+        # Index of the first frame not yet reported
+        self._next = 0
+
+        self._wakeup = threading.Event()
+        self._counter = counter
+        self._token = None
+        if counter is not None:
+            self._token = counter.subscribe(self._on_counter, run=False)
+
+        self._inotify = None
+        if use_inotify and inotify_simple is not None:
+            self._inotify = inotify_simple.INotify()
+            flags = inotify_simple.flags
+            self._inotify.add_watch(data_directory_name, flags.CLOSE_WRITE | flags.MOVED_TO)
+
+    def _on_counter(self, value, old_value=None, **kwargs):
+        self._wakeup.set()
+
+    @property
+    def done(self):
+        return self._next == self.num_images
+
+    def poll(self):
+        """
+        Frame numbers completed since the previous call, without blocking.
+        """
+        if self._inotify is not None:
+            # Drain the events, which are only needed to wake wait()
+            self._inotify.read(timeout=0)
+        start = self._next
+        while self._next < self.num_images and cbf_complete(self._paths[self._next]):
+            self._next += 1
+        return list(range(self.file_number_start + start, self.file_number_start + self._next))
+
+    def wait(self, timeout=None):
+        """
+        Block until more frames are complete, or ``timeout`` seconds have passed.
+
+        Returns the newly completed frame numbers, which is empty on timeout.
+        """
+        deadline = None if timeout is None else ttime.monotonic() + timeout
+        while True:
+            frames = self.poll()
+            if frames or self.done:
+                return frames
+            interval = self.poll_interval
+            if deadline is not None:
+                interval = min(interval, deadline - ttime.monotonic())
+                if interval <= 0:
+                    return []
+            if self._inotify is not None:
+                self._inotify.read(timeout=int(interval * 1000))
+            elif self._wakeup.wait(interval):
+                self._wakeup.clear()
+
+    def __iter__(self):
+        while not self.done:
+            yield from self.wait()
+
+    def close(self):
+        if self._token is not None:
+            self._counter.unsubscribe(self._token)
+            self._token = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None